@@ -0,0 +1,223 @@
+"""
+Async versions of the CRUD and settings handlers.
+
+With DATABASE_ASYNC=true, install() swaps the sync handlers in main.py for these, which
+run on an AsyncSession (aiosqlite, or asyncpg for Postgres) instead of holding a
+threadpool thread for the whole database round trip. Paths, parameters and responses are
+the same as the sync handlers; authentication still goes through main's (cached) auth
+dependencies. Write side effects go through main.on_data_changed like the sync path.
+"""
+import datetime
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import rollups
+from columnar import negotiate_format, rows_response, FORMATS, STREAM_FORMATS
+from export import row_payload, stream_tables
+from fast_json import json_rows_response, model_columns
+from pagination import keyset_query, page_rows
+from main import (
+    get_async_db, require_auth, require_write_access, on_data_changed, settings_cache, conditional_get, check_pk_settings,
+    LogCreate, JabCreate, BodyMeasurementCreate, SettingUpdate,
+    LOG_NUMERIC_FIELDS, BODY_MEASUREMENT_NUMERIC_FIELDS,
+)
+from session_cache import SessionUser
+from conditional import make_etag, etag_matches, etag_headers, not_modified
+
+router = APIRouter()
+
+
+def _add_table_routes(path: str, table: str, model, create_model, numeric_fields, label: str):
+    """Register list/create/update/delete/last handlers for one history table."""
+    formats = (FORMATS if numeric_fields else ("json",)) + STREAM_FORMATS
+
+    @router.get(path, dependencies=[conditional_get(table)])
+    async def list_rows(
+        since: datetime.date | None = None,
+        until: datetime.date | None = None,
+        limit: int | None = Query(None, ge=1),
+        cursor: str | None = None,
+        format: str | None = None,
+        accept: str | None = Header(None),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: SessionUser = Depends(require_auth)
+    ):
+        response_format = negotiate_format(format, accept, formats)
+        if response_format in STREAM_FORMATS:
+            return stream_tables([table], response_format, since, until, cursor)
+        if response_format != "json":
+            columns = [model.id, model.date, model.time] + [getattr(model, field) for field in numeric_fields]
+            result = await db.execute(keyset_query(select(*columns), model, since, until, cursor, limit))
+            rows, headers = page_rows(result.all(), limit)
+            return rows_response(rows, numeric_fields, response_format, headers)
+        columns = model_columns(model)
+        result = await db.execute(keyset_query(select(*columns), model, since, until, cursor, limit))
+        rows, headers = page_rows(result.all(), limit)
+        return json_rows_response(rows, [column.name for column in columns], headers)
+
+    @router.post(path)
+    async def create_row(item: create_model, db: AsyncSession = Depends(get_async_db), user: SessionUser = Depends(require_write_access)):
+        values = item.dict()
+        values["date"] = values["date"] or datetime.date.today()
+        values["time"] = values["time"] or datetime.datetime.now().time()
+        db_row = model(**values)
+        db.add(db_row)
+        await db.run_sync(rollups.refresh, table, [db_row.date])
+        await db.commit()
+        on_data_changed(table, "create", db_row.id, db_row)
+        await db.refresh(db_row)
+        return row_payload(db_row)
+
+    @router.put(path + "/{row_id}")
+    async def update_row(row_id: int, item: create_model, db: AsyncSession = Depends(get_async_db), user: SessionUser = Depends(require_write_access)):
+        db_row = await db.get(model, row_id)
+        if db_row is None or db_row.deleted:
+            raise HTTPException(status_code=404, detail=f"{label} not found")
+
+        old_date = db_row.date
+        for key, value in item.dict(exclude_unset=True).items():
+            setattr(db_row, key, value)
+
+        await db.run_sync(rollups.refresh, table, [old_date, db_row.date])
+        await db.commit()
+        on_data_changed(table, "update", db_row.id, db_row)
+        await db.refresh(db_row)
+        return row_payload(db_row)
+
+    @router.delete(path + "/{row_id}")
+    async def delete_row(row_id: int, db: AsyncSession = Depends(get_async_db), user: SessionUser = Depends(require_write_access)):
+        db_row = await db.get(model, row_id)
+        if db_row is None or db_row.deleted:
+            raise HTTPException(status_code=404, detail=f"{label} not found")
+
+        db_row.deleted = True
+        await db.run_sync(rollups.refresh, table, [db_row.date])
+        await db.commit()
+        on_data_changed(table, "delete", row_id)
+        return {"ok": True}
+
+    @router.get(path + "/last", dependencies=[conditional_get(table)])
+    async def get_last_row(db: AsyncSession = Depends(get_async_db), current_user: SessionUser = Depends(require_auth)):
+        last_row = (await db.execute(select(model).where(model.deleted == False).order_by(model.id.desc()).limit(1))).scalar_one_or_none()
+        if last_row is None:
+            raise HTTPException(status_code=404, detail=f"No {label.lower()}s found")
+        return row_payload(last_row)
+
+
+_add_table_routes("/api/logs", "logs", models.Log, LogCreate, LOG_NUMERIC_FIELDS, "Log")
+_add_table_routes("/api/jabs", "jabs", models.Jab, JabCreate, [], "Jab")
+_add_table_routes("/api/body-measurements", "body_measurements", models.BodyMeasurement, BodyMeasurementCreate, BODY_MEASUREMENT_NUMERIC_FIELDS, "Body measurement")
+
+
+def _setting_query(user_id: int, setting_key: str):
+    return select(models.UserSettings).where(
+        models.UserSettings.user_id == user_id,
+        models.UserSettings.setting_key == setting_key,
+        models.UserSettings.deleted == False
+    )
+
+
+async def load_user_settings(db: AsyncSession, user_id: int) -> tuple[int, dict[str, str]]:
+    """Async counterpart of main.load_user_settings."""
+    version, settings = settings_cache.get(user_id)
+    if settings is None:
+        result = await db.execute(select(models.UserSettings.setting_key, models.UserSettings.setting_value).where(
+            models.UserSettings.user_id == user_id, models.UserSettings.deleted == False
+        ))
+        settings = {key: value for key, value in result.all()}
+        settings_cache.put(user_id, version, settings)
+    return version, settings
+
+
+@router.get("/api/settings")
+async def get_user_settings(
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """Get all settings for the current user. Returns a dict of key-value pairs, with ETag / 304."""
+    version, settings = await load_user_settings(db, current_user.id)
+    etag = make_etag("settings", current_user.id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return settings
+
+
+@router.get("/api/settings/{setting_key}")
+async def get_user_setting(setting_key: str, db: AsyncSession = Depends(get_async_db), current_user: SessionUser = Depends(require_auth)):
+    """Get a specific setting for the current user."""
+    _, settings = await load_user_settings(db, current_user.id)
+    if setting_key not in settings:
+        raise HTTPException(status_code=404, detail="Setting not found")
+    return {"setting_key": setting_key, "setting_value": settings[setting_key]}
+
+
+@router.put("/api/settings/{setting_key}")
+async def update_user_setting(
+    setting_key: str,
+    setting_update: SettingUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """Update or create a setting for the current user. Authorized users (including read-only) can update settings."""
+    check_pk_settings({setting_key: setting_update.setting_value})
+    await db.execute(models.upsert_settings_statement(
+        db.bind.dialect.name, current_user.id, {setting_key: setting_update.setting_value}
+    ))
+    await db.commit()
+    on_data_changed("user_settings", "upsert", setting_key, {setting_key: setting_update.setting_value}, user_id=current_user.id)
+    return {"setting_key": setting_key, "setting_value": setting_update.setting_value}
+
+
+@router.post("/api/settings")
+async def batch_update_settings(
+    settings: dict[str, str],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """Batch update multiple settings for the current user, as a single upsert statement."""
+    check_pk_settings(settings)
+    if settings:
+        await db.execute(models.upsert_settings_statement(db.bind.dialect.name, current_user.id, settings))
+        await db.commit()
+        on_data_changed("user_settings", "upsert", row=settings, user_id=current_user.id)
+    return dict(settings)
+
+
+@router.delete("/api/settings/{setting_key}")
+async def delete_user_setting(
+    setting_key: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """Delete a setting for the current user."""
+    setting = (await db.execute(_setting_query(current_user.id, setting_key))).scalar_one_or_none()
+    if setting is None:
+        raise HTTPException(status_code=404, detail="Setting not found")
+
+    setting.deleted = True
+    await db.commit()
+    on_data_changed("user_settings", "delete", setting_key, user_id=current_user.id)
+    return {"ok": True}
+
+
+def _route_shape(path: str) -> str:
+    """Path with its parameter names blanked, /api/logs/{log_id} and /api/logs/{row_id} match the same URLs."""
+    return re.sub(r"\{[^}]*\}", "{}", path)
+
+
+def install(app):
+    """Replace the sync handlers of app with the async handlers of this module."""
+    replaced = {(_route_shape(route.path), method) for route in router.routes for method in route.methods}
+    app.router.routes = [
+        route for route in app.router.routes
+        if not (isinstance(route, APIRoute) and any((_route_shape(route.path), method) in replaced for method in route.methods))
+    ]
+    app.include_router(router)
@@ -0,0 +1,97 @@
+"""
+Compare the sync and async (DATABASE_ASYNC=true) database paths under concurrent load.
+
+Starts the backend once per mode with uvicorn on a throwaway SQLite database, seeds it,
+then fires concurrent GET requests at the list endpoints and reports throughput and
+latency percentiles. Needs uvicorn and httpx.
+
+    cd backend && python benchmarks/db_concurrency.py --rows 2000 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["/api/logs", "/api/jabs", "/api/logs/last", "/api/settings"]
+
+
+def start_server(database_url: str, port: int, async_mode: bool):
+    env = dict(os.environ, DATABASE_URL=database_url, DATABASE_ASYNC="true" if async_mode else "false",
+               ENVIRONMENT="development", AUTH_SECRET="benchmark")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/auth/me")
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+async def run_load(base_url: str, rows: int, requests: int, concurrency: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/api/auth/register", json={"username": "admin", "password": "benchmark", "read_only": False})
+        await client.post("/api/auth/login", json={"username": "admin", "password": "benchmark"})
+        for i in range(rows):
+            await client.post("/api/logs", json={"weight": 80 + i % 10, "sleep": 7})
+        for i in range(rows // 20 + 1):
+            await client.post("/api/jabs", json={"dose": 2.5})
+
+        latencies = []
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(ENDPOINTS[i % len(ENDPOINTS)])
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "req_per_s": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for async_mode in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = start_server(f"sqlite:///{tmp}/benchmark.db", args.port, async_mode)
+            try:
+                result = asyncio.run(run_load(f"http://127.0.0.1:{args.port}", args.rows, args.requests, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+        print(f"{'async' if async_mode else 'sync ':5}  " + "  ".join(f"{key}={value:.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Throughput of POST /api/import and of its phases.
+
+Builds an NDJSON body of --rows logs (one per hour, so years of dates and rollup buckets),
+then times, on throwaway SQLite databases:
+    - parse + validate (importer.iter_ndjson, validate_rows)
+    - insert (Core executemany, without the rollup refresh)
+    - rollups.refresh over all imported dates
+    - the whole request through the app (TestClient, no network)
+
+    cd backend && python benchmarks/import_rows.py --rows 30000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ndjson_body(rows: int) -> str:
+    start = datetime.datetime(2020, 1, 1, 7, 0)
+    lines = []
+    for i in range(rows):
+        moment = start + datetime.timedelta(hours=i)
+        lines.append(json.dumps({
+            "table": "logs", "date": moment.date().isoformat(), "time": moment.time().isoformat(),
+            "weight": round(random.uniform(60, 100), 1), "body_fat": round(random.uniform(10, 30), 1),
+            "muscle": round(random.uniform(30, 50), 1), "visceral_fat": random.randint(1, 20),
+            "sleep": round(random.uniform(5, 9), 2),
+        }))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=30000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory}/phases.db"
+    os.environ["ENVIRONMENT"] = "development"
+    sys.path.insert(0, BACKEND_DIR)
+    from fastapi.testclient import TestClient
+    from sqlalchemy import insert
+
+    import main
+    import models
+    import rollups
+    from importer import iter_ndjson, validate_rows
+
+    body = ndjson_body(args.rows)
+
+    started = time.perf_counter()
+    valid, errors = validate_rows(iter_ndjson(body, None), main.IMPORT_SCHEMAS)
+    validated = time.perf_counter()
+    assert not errors and len(valid["logs"]) == args.rows
+    db = models.SessionLocal()
+    for start in range(0, args.rows, 1000):
+        db.execute(insert(models.Log.__table__), valid["logs"][start:start + 1000])
+    inserted = time.perf_counter()
+    rollups.refresh(db, "logs", {row["date"] for row in valid["logs"]})
+    refreshed = time.perf_counter()
+    db.commit()
+    db.close()
+
+    for name, seconds in (("parse + validate", validated - started), ("insert", inserted - validated),
+                          ("rollups.refresh", refreshed - inserted)):
+        print(f"{name:<18}{seconds:>8.2f} s{args.rows / seconds:>12,.0f} rows/s")
+
+    # The full request, on an empty table
+    db = models.SessionLocal()
+    db.query(models.Log).delete()
+    db.query(models.MetricRollup).delete()
+    db.commit()
+    db.close()
+    client = TestClient(main.app)
+    client.post("/api/auth/register", json={"username": main.ADMIN_USER, "password": "benchmark", "read_only": False})
+    token = client.post("/api/auth/login", json={"username": main.ADMIN_USER, "password": "benchmark"}).cookies["auth_token"]
+    client.cookies.clear()
+    client.cookies.set("auth_token", token)
+    started = time.perf_counter()
+    response = client.post("/api/import", content=body.encode(), headers={"Content-Type": "application/x-ndjson"})
+    seconds = time.perf_counter() - started
+    assert response.status_code == 200, response.text
+    print(f"{'POST /api/import':<18}{seconds:>8.2f} s{args.rows / seconds:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
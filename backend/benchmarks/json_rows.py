@@ -0,0 +1,89 @@
+"""
+Per-row cost of serializing the list endpoints' JSON, before and after the direct row path.
+
+Seeds a throwaway SQLite database with --rows logs, jabs and body measurements, then times
+both ways of producing the /api/<table> body, in process (no HTTP):
+    - orm:  db.query(Model) -> FastAPI's jsonable_encoder -> JSONResponse (the old path)
+    - core: select(*columns) tuples -> dicts -> FastJSONResponse (orjson)
+and checks that both decode to the same rows.
+
+    cd backend && python benchmarks/json_rows.py --rows 10000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(models, rows: int):
+    db = models.SessionLocal()
+    start = datetime.date(2000, 1, 1)
+    for i in range(rows):
+        date, moment = start + datetime.timedelta(days=i), datetime.time(7, 30, random.randint(0, 59))
+        db.add(models.Log(date=date, time=moment, weight=round(random.uniform(60, 100), 1),
+                          body_fat=round(random.uniform(10, 30), 1), muscle=round(random.uniform(30, 50), 1),
+                          visceral_fat=random.randint(1, 20), sleep=round(random.uniform(5, 9), 2), notes="ok"))
+        db.add(models.Jab(date=date, time=moment, dose=2.5))
+        db.add(models.BodyMeasurement(date=date, time=moment, **{
+            field: round(random.uniform(20, 120), 1)
+            for field in ("upper_arm_left", "upper_arm_right", "chest", "waist", "thigh_left", "thigh_right", "face", "neck")
+        }))
+    db.commit()
+    db.close()
+
+
+def best_of(repeats: int, fn):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    sys.path.insert(0, BACKEND_DIR)
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import models
+    from fast_json import json_rows_response, model_columns
+    from pagination import keyset_query
+
+    seed(models, args.rows)
+    db = models.SessionLocal()
+    print(f"{'table':<20}{'orm us/row':>12}{'core us/row':>13}{'speedup':>9}")
+    for model in (models.Log, models.Jab, models.BodyMeasurement):
+        columns = model_columns(model)
+        names = [column.name for column in columns]
+
+        def orm_body():
+            db.expunge_all()
+            return JSONResponse(jsonable_encoder(keyset_query(db.query(model), model).all())).body
+
+        def core_body():
+            return json_rows_response(keyset_query(db.query(*columns), model).all(), names).body
+
+        orm_seconds, orm = best_of(args.repeats, orm_body)
+        core_seconds, core = best_of(args.repeats, core_body)
+        if json.loads(orm) != json.loads(core):
+            raise SystemExit(f"{model.__tablename__}: bodies differ")
+        print(f"{model.__tablename__:<20}{orm_seconds / args.rows * 1e6:>12.2f}{core_seconds / args.rows * 1e6:>13.2f}"
+              f"{orm_seconds / core_seconds:>8.1f}x")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
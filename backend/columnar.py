@@ -0,0 +1,125 @@
+"""
+Columnar response formats for the time-series endpoints.
+
+Besides the default list of JSON objects, the time-series endpoints can answer with
+    - "columnar": one JSON array per column instead of one object per row
+    - "binary": the columns as packed little-endian arrays, one after another
+
+The list endpoints can also stream "ndjson" or "csv", see export.py.
+
+The binary body is described by response headers:
+    - X-Columns: comma separated "name:dtype" pairs in body order (numpy dtype strings, e.g. "<f4")
+    - X-Row-Count: number of rows, i.e. the length of every column
+Missing values are NaN in float columns.
+"""
+import datetime
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from fastapi import HTTPException, Response
+
+FORMATS = ("json", "columnar", "binary")
+STREAM_FORMATS = ("ndjson", "csv")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+COLUMNAR_MEDIA_TYPE = "application/vnd.horohelper.columnar+json"
+
+# Accept header media types that select a format
+ACCEPT_FORMATS = {
+    BINARY_MEDIA_TYPE: "binary",
+    COLUMNAR_MEDIA_TYPE: "columnar",
+    "application/x-ndjson": "ndjson",
+    "text/csv": "csv",
+}
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def negotiate_format(format: str | None, accept: str | None, allowed=FORMATS) -> str:
+    """Pick the response format from the format= parameter, falling back to the Accept header."""
+    if format is not None:
+        if format not in allowed:
+            raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(allowed)}")
+        return format
+    if accept:
+        for media_type, accepted_format in ACCEPT_FORMATS.items():
+            if media_type in accept and accepted_format in allowed:
+                return accepted_format
+    return "json"
+
+
+def epoch_seconds(date: datetime.date, time: datetime.time) -> float:
+    """Seconds since 1970-01-01 for a naive date + time, reading the wall-clock time as UTC."""
+    return (datetime.datetime.combine(date, time) - _EPOCH).total_seconds()
+
+
+def binary_response(columns: Dict[str, np.ndarray], headers: Dict[str, str] | None = None) -> Response:
+    """Pack equally long, already typed numpy columns into one little-endian binary body."""
+    arrays = {}
+    for name, values in columns.items():
+        array = np.ascontiguousarray(values)
+        arrays[name] = array.astype(array.dtype.newbyteorder("<"), copy=False)
+    row_count = len(next(iter(arrays.values()))) if arrays else 0
+    response_headers = {
+        "X-Columns": ",".join(f"{name}:{array.dtype.str}" for name, array in arrays.items()),
+        "X-Row-Count": str(row_count),
+    }
+    response_headers.update(headers or {})
+    body = b"".join(array.tobytes() for array in arrays.values())
+    return Response(content=body, media_type=BINARY_MEDIA_TYPE, headers=response_headers)
+
+
+def row_columns(rows: Sequence[Any], numeric_fields: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Turn (id, date, time, *numeric_fields) rows into typed columns.
+
+    Returns id (int32), epoch (float64, see epoch_seconds) and one float32 column per
+    numeric field, with NULLs as NaN.
+    """
+    count = len(rows)
+    columns = {
+        "id": np.fromiter((row[0] for row in rows), dtype=np.int32, count=count),
+        "epoch": np.fromiter((epoch_seconds(row[1], row[2]) for row in rows), dtype=np.float64, count=count),
+    }
+    values = np.array([row[3:] for row in rows], dtype=np.float32).reshape(count, len(numeric_fields))
+    for i, field in enumerate(numeric_fields):
+        columns[field] = values[:, i]
+    return columns
+
+
+def rows_response(rows: Sequence[Any], numeric_fields: List[str], format: str, headers: Dict[str, str] | None = None):
+    """Columnar JSON or binary response for (id, date, time, *numeric_fields) rows."""
+    if format == "binary":
+        return binary_response(row_columns(rows, numeric_fields), headers)
+
+    # JSON keeps NULLs as null, so build the columns straight from the row tuples
+    columns = list(zip(*rows)) if rows else [()] * (3 + len(numeric_fields))
+    result = {
+        "count": len(rows),
+        "id": list(columns[0]),
+        "epoch": [epoch_seconds(date, time) for date, time in zip(columns[1], columns[2])],
+    }
+    for i, field in enumerate(numeric_fields):
+        result[field] = list(columns[3 + i])
+    return result
+
+
+def medication_levels_response(columns: Dict[str, Any], format: str):
+    """Columnar JSON or binary response for medication_level_columns output."""
+    if format == "binary":
+        body_columns = {"level": columns["level"]}
+        if columns["offset_seconds"] is not None:
+            body_columns = {"offset_seconds": columns["offset_seconds"], "level": columns["level"]}
+        headers = {
+            "X-Start-Epoch": "" if columns["start_epoch"] is None else repr(columns["start_epoch"]),
+            "X-Step-Seconds": "" if columns["step_seconds"] is None else str(columns["step_seconds"]),
+        }
+        return binary_response(body_columns, headers)
+
+    result = {
+        "start_epoch": columns["start_epoch"],
+        "step_seconds": columns["step_seconds"],
+        "levels": columns["level"].astype(np.float64).round(2).tolist(),
+    }
+    if columns["offset_seconds"] is not None:
+        result["offset_seconds"] = columns["offset_seconds"].tolist()
+    return result
@@ -0,0 +1,68 @@
+"""
+ETag helpers for conditional GETs.
+
+ETags are built from in-process version counters plus a per-process boot id, so a
+restart (which resets the counters) can never produce an ETag a client already holds
+for different content. Responses carry Cache-Control: private, no-cache, which lets the
+browser keep them but makes it revalidate with If-None-Match on every use.
+"""
+import hashlib
+import secrets
+import threading
+
+from fastapi import Response
+
+BOOT_ID = secrets.token_hex(4)
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join([BOOT_ID] + [str(part) for part in parts]) + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True if the If-None-Match header lists etag (weak comparison) or is *."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
+
+
+class NotModified(Exception):
+    """Raised by a conditional GET dependency when the client's copy is current."""
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+class TableVersions:
+    """Monotonic per-table change counters, bumped by the write handlers."""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str) -> int:
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def bump(self, table: str) -> int:
+        with self._lock:
+            version = self._versions.get(table, 0) + 1
+            self._versions[table] = version
+            return version
+
+
+def request_fingerprint(request) -> str:
+    """Short hash of what else shapes a response: the path, query parameters and the Accept header."""
+    key = repr((request.url.path, sorted(request.query_params.multi_items()), request.headers.get("accept", "")))
+    return hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
@@ -0,0 +1,129 @@
+"""
+Server-sent events push channel for data changes.
+
+Write handlers publish a compact change event ({"table", "op", "id", "row"}) after they
+commit. The broadcaster encodes it once and hands it to every subscribed stream on that
+stream's event loop, so publishing works from the sync handlers' threadpool threads as
+well as from async handlers. Each subscriber has a bounded queue: a client too slow to
+keep up is dropped (its stream ends and the browser's EventSource reconnects, catching
+up through /api/sync) instead of the server buffering without limit. Idle streams get a
+comment line every heartbeat seconds so proxies keep the connection open.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Optional
+
+from export import row_payload
+
+# Sentinel queued to end a stream (dropped subscriber or shutdown)
+_CLOSE = None
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int, user_id: Optional[int]):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.user_id = user_id
+        self.closed = False
+        self.dropped = False
+
+    def deliver(self, message: Optional[str]):
+        """Runs on the subscriber's loop."""
+        if self.closed:
+            return
+        if message is not _CLOSE and not self.queue.full():
+            self.queue.put_nowait(message)
+            return
+        # Shutting down, or too slow to keep up: forget the backlog and end the stream
+        self.closed = True
+        self.dropped = message is not _CLOSE
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSE)
+
+
+class EventBroadcaster:
+    def __init__(self, queue_size: int = 100, heartbeat: float = 15.0):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, table: str, op: str, row_id=None, row=None, user_id: Optional[int] = None):
+        """
+        Send a change event to all subscribers, or only to user_id's when given (settings).
+        row is an ORM row or a plain dict; it is only serialized if someone is listening.
+        """
+        with self._lock:
+            subscribers = [
+                subscriber for subscriber in self._subscribers
+                if user_id is None or subscriber.user_id == user_id
+            ]
+            event_id = next(self._ids)
+            self.published += 1
+        if not subscribers:
+            return
+        if row is not None and not isinstance(row, dict):
+            row = row_payload(row)
+        data = json.dumps({"table": table, "op": op, "id": row_id, "row": row})
+        message = f"id: {event_id}\nevent: change\ndata: {data}\n\n"
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, message)
+            except RuntimeError:
+                pass  # loop already closed, the stream's cleanup will unsubscribe it
+
+    def subscribe(self, user_id: Optional[int] = None) -> Subscriber:
+        """Register a stream; call from the event loop that will consume it."""
+        subscriber = Subscriber(asyncio.get_running_loop(), self.queue_size, user_id)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if subscriber.dropped:
+                self.dropped += 1
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[str]:
+        """SSE text for subscriber: a retry hint, then events and heartbeats until it is dropped."""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is _CLOSE:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close(self):
+        """End every stream, e.g. on shutdown."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, _CLOSE)
+            except RuntimeError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped": self.dropped,
+                "queue_size": self.queue_size,
+            }
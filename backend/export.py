@@ -0,0 +1,99 @@
+"""
+Streaming NDJSON / CSV export of the history tables.
+
+Rows are read with yield_per and written out in chunks through a StreamingResponse, so
+memory stays flat regardless of table size and the first bytes go out before the query
+has finished. The generators open their own session because they keep running after the
+endpoint (and its request-scoped session) has returned.
+"""
+import csv
+import datetime
+import io
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+import models
+from fast_json import model_columns
+from models import SessionLocal
+from pagination import keyset_query
+
+EXPORT_TABLES = {
+    "logs": models.Log,
+    "jabs": models.Jab,
+    "body_measurements": models.BodyMeasurement,
+}
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+BATCH_SIZE = 500
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def row_payload(row) -> dict:
+    """JSON-ready payload of an ORM row, the same fields as the list endpoints return."""
+    return {column.name: _plain(getattr(row, column.name)) for column in model_columns(type(row))}
+
+
+def iter_row_batches(model, since=None, until=None, cursor=None, batch_size=BATCH_SIZE):
+    """Yield (column names, list of row tuples) in batches of at most batch_size rows."""
+    columns = model_columns(model)
+    names = [column.name for column in columns]
+    db = SessionLocal()
+    try:
+        statement = keyset_query(db.query(*columns), model, since, until, cursor).statement
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield names, partition
+    finally:
+        db.close()
+
+
+def ndjson_chunks(tables, since=None, until=None, cursor=None, tag_table=False):
+    """One JSON object per line; with tag_table each object also carries its table name."""
+    for table in tables:
+        for names, rows in iter_row_batches(EXPORT_TABLES[table], since, until, cursor):
+            lines = []
+            for row in rows:
+                record = {"table": table} if tag_table else {}
+                record.update(zip(names, map(_plain, row)))
+                lines.append(json.dumps(record))
+            yield "\n".join(lines) + "\n"
+
+
+def csv_chunks(table, since=None, until=None, cursor=None):
+    """CSV with a header row; NULL becomes an empty field."""
+    header_written = False
+    for names, rows in iter_row_batches(EXPORT_TABLES[table], since, until, cursor):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(names)
+            header_written = True
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+    if not header_written:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(column.name for column in model_columns(EXPORT_TABLES[table]))
+        yield buffer.getvalue()
+
+
+def stream_tables(tables, format: str, since=None, until=None, cursor=None) -> StreamingResponse:
+    """StreamingResponse exporting the given tables as NDJSON (any number) or CSV (a single table)."""
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown table(s): {', '.join(unknown)}")
+    if format == "csv":
+        if len(tables) != 1:
+            raise HTTPException(status_code=400, detail="CSV export needs exactly one table")
+        chunks = csv_chunks(tables[0], since, until, cursor)
+    else:
+        chunks = ndjson_chunks(tables, since, until, cursor, tag_table=len(tables) > 1)
+    return StreamingResponse(chunks, media_type=STREAM_MEDIA_TYPES[format])
@@ -0,0 +1,62 @@
+"""
+Fast JSON encoding for API responses.
+
+FastJSONResponse is the app's default response class. It encodes with orjson and falls back
+to the json module, with the same settings as Starlette's JSONResponse, whenever orjson's
+bytes could differ: orjson writes floats below 1e-4 and from 1e16 differently ("0.00001"
+and "1e16" where json writes "1e-05" and "1e+16"). Either way the body is what
+JSONResponse would have sent.
+
+json_rows_response() is the direct path for row lists. It takes Core select() rows (plain tuples)
+and zips them with the column names in column order. The result is encoded as is, without
+ORM hydration or FastAPI's jsonable_encoder pass. orjson writes dates, times and datetimes
+in the same ISO format as jsonable_encoder. The values match the old ORM responses, but the key
+order does not. Those objects kept their keys in attribute load order, which varied between
+processes (it depends on the hash seed). Rows are now always keyed in table column order.
+"""
+import datetime
+import json
+import re
+from typing import Any, Dict, List, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from models import SYNC_ONLY_COLUMNS
+
+# Bytes where orjson and json may format a float differently: an exponent, or four zeros after
+# a decimal point. Matches inside strings too, which only costs a fallback.
+_FLOAT_FORMAT_MAY_DIFFER = re.compile(rb"\de|0\.0000")
+
+
+def _iso_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        try:
+            body = orjson.dumps(content)
+        except TypeError:  # e.g. integers beyond 64 bits
+            body = None
+        if body is None or _FLOAT_FORMAT_MAY_DIFFER.search(body):
+            return json.dumps(
+                content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_iso_default
+            ).encode("utf-8")
+        return body
+
+
+def model_columns(model) -> list:
+    """The columns of model's row payloads: all but the sync bookkeeping (models.SYNC_ONLY_COLUMNS)."""
+    return [column for column in model.__table__.columns if column.name not in SYNC_ONLY_COLUMNS]
+
+
+def row_dicts(rows: Sequence, names: Sequence[str]) -> List[Dict[str, Any]]:
+    return [dict(zip(names, row)) for row in rows]
+
+
+def json_rows_response(rows: Sequence, names: Sequence[str], headers: Dict[str, str] | None = None) -> FastJSONResponse:
+    """JSON list of objects for Core rows with the given column names."""
+    return FastJSONResponse(row_dicts(rows, names), headers=headers)
@@ -0,0 +1,118 @@
+"""
+Bulk import of logs, jabs and body measurements from NDJSON or CSV, the formats /api/export writes.
+
+Every row is validated with the API's create model for its table first; the valid rows are
+then inserted with executemany INSERTs of IMPORT_CHUNK_SIZE rows, all in one transaction
+together with the rollup refresh, so an import is either applied as a whole or not at all.
+Exported ids are ignored, imported rows get new ones.
+"""
+import csv
+import datetime
+import io
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+
+import rollups
+from export import EXPORT_TABLES
+
+IMPORT_CHUNK_SIZE = 1000
+# Rows listed in the response; error_count still counts all of them
+MAX_REPORTED_ERRORS = 100
+
+# (line number, table, row or None, error or None)
+ParsedRow = Tuple[int, Optional[str], Optional[Dict[str, Any]], Optional[str]]
+
+
+def iter_ndjson(text: str, table: Optional[str] = None) -> Iterator[ParsedRow]:
+    """Rows of NDJSON text. A "table" key on the row wins over table; blank lines are skipped."""
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield line_number, table, None, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, table, None, "Expected a JSON object"
+            continue
+        yield line_number, row.pop("table", table), row, None
+
+
+def iter_csv(text: str, table: Optional[str]) -> Iterator[ParsedRow]:
+    """Rows of CSV text with a header row. Empty fields become None, as export writes NULL."""
+    reader = csv.DictReader(io.StringIO(text))
+    for row in reader:
+        if None in row:
+            yield reader.line_num, table, None, "More fields than the header"
+            continue
+        yield reader.line_num, table, {key: value if value != "" else None for key, value in row.items()}, None
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+    )
+
+
+def validate_rows(rows, schemas: Dict[str, type[BaseModel]]) -> Tuple[Dict[str, List[Dict]], List[Dict]]:
+    """
+    Split parsed rows into the valid values per table and the errors ({"line", "error"}).
+    Missing dates and times default to now, like the create endpoints.
+    """
+    today = datetime.date.today()
+    now = datetime.datetime.now().time()
+    valid: Dict[str, List[Dict]] = defaultdict(list)
+    errors: List[Dict] = []
+    for line_number, table, row, error in rows:
+        if error is None and table not in schemas:
+            error = f"Unknown table: {table}" if table else "No table given"
+        if error is None:
+            try:
+                values = schemas[table].model_validate(row).model_dump()
+            except ValidationError as exc:
+                error = _describe(exc)
+            else:
+                values["date"] = values["date"] or today
+                values["time"] = values["time"] or now
+                valid[table].append(values)
+                continue
+        errors.append({"line": line_number, "error": error})
+    return valid, errors
+
+
+def insert_rows(db, valid: Dict[str, List[Dict]], chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict[str, int]:
+    """Insert the validated rows and refresh their rollups. Does not commit, returns counts per table."""
+    inserted = {}
+    for table, rows in valid.items():
+        statement = insert(EXPORT_TABLES[table].__table__)
+        for start in range(0, len(rows), chunk_size):
+            db.execute(statement, rows[start:start + chunk_size])
+        rollups.refresh(db, table, {row["date"] for row in rows})
+        inserted[table] = len(rows)
+    return inserted
+
+
+def import_rows(db, rows, schemas: Dict[str, type[BaseModel]], skip_invalid: bool = False) -> Dict[str, Any]:
+    """
+    Validate and insert parsed rows, committing once. Unless skip_invalid, any invalid row
+    means nothing is inserted. Returns {"inserted": {table: count}, "error_count", "errors"}.
+    """
+    valid, errors = validate_rows(rows, schemas)
+    inserted = {}
+    if valid and (skip_invalid or not errors):
+        try:
+            inserted = insert_rows(db, valid)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return {
+        "inserted": inserted,
+        "error_count": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
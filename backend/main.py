@@ -1,18 +1,36 @@
+import asyncio
 import datetime
 import os
 import secrets
 import hashlib
 import logging
-import bcrypt
 import hmac
 import time
-from fastapi import FastAPI, Depends, HTTPException, Response, Cookie
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Response, Request, Cookie, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import models
+import rollups
 from models import SessionLocal, engine
-from pydantic import BaseModel
-from medication_calculator import calculate_medication_levels
+from pydantic import BaseModel, Field
+from medication_calculator import MedicationLevelCache, project_medication_levels, PK_VARIABILITY, PKParameters, DEFAULT_PK_PARAMETERS
+from medication_worker import MedicationPrecomputer, CurveStore
+from columnar import negotiate_format, rows_response, medication_levels_response, FORMATS, STREAM_FORMATS
+from export import row_payload, stream_tables, EXPORT_TABLES
+from fast_json import FastJSONResponse, json_rows_response, model_columns, row_dicts
+from importer import iter_csv, iter_ndjson, import_rows
+from sync import purge_tombstones, sync_changes
+from events import EventBroadcaster
+from metrics import Metrics
+from session_cache import SessionCache, SessionUser
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from settings_cache import SettingsCache
+from trend import lowess_trend, TrendCache
+from conditional import make_etag, etag_matches, etag_headers, not_modified, NotModified, TableVersions, request_fingerprint
+from pagination import keyset_query, fetch_page, NEXT_CURSOR_HEADER
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -26,7 +44,66 @@ ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 # Check if we're in development mode (for cookie security settings)
 IS_DEVELOPMENT = os.getenv("ENVIRONMENT", "production") == "development"
 
-app = FastAPI()
+# Dedicated, bounded pool for bcrypt so login bursts can't starve the request threadpool
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "8")),
+)
+
+# Per-route latency and query counts for /api/metrics, plus the slow-query log
+request_metrics = Metrics(
+    slow_query_seconds=float(os.getenv("SLOW_QUERY_MS", "100")) / 1000,
+    explain_slow_queries=os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() == "true",
+)
+request_metrics.instrument_engine(engine)
+if models.async_engine is not None:
+    request_metrics.instrument_engine(models.async_engine.sync_engine)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report = models.storage_report()
+    logger.info("Storage settings in effect: " + ", ".join(f"{key}={value}" for key, value in report.items()))
+    medication_precomputer.schedule(table_versions.get("jabs"))
+    purge_task = asyncio.create_task(purge_tombstones_periodically())
+    yield
+    purge_task.cancel()
+    event_broadcaster.close()
+    medication_precomputer.shutdown()
+    password_hasher.shutdown()
+    if models.async_engine is not None:
+        await models.async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    return not_modified(exc.etag)
+
+@app.middleware("http")
+async def add_etag_header(request: Request, call_next):
+    """Attach the ETag computed by conditional_get, also to directly returned (binary / streamed) responses."""
+    response = await call_next(request)
+    etag = getattr(request.state, "etag", None)
+    if etag is not None and response.status_code == 200 and "etag" not in response.headers:
+        response.headers.update(etag_headers(etag))
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time the request per route and report its database work in a Server-Timing header."""
+    timing, token = request_metrics.start_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        elapsed = request_metrics.finish_request(
+            timing, token, request.method, route.path if route is not None else "unmatched", status
+        )
+    response.headers["Server-Timing"] = request_metrics.server_timing(timing, elapsed)
+    return response
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,11 +111,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Columns", "X-Row-Count", "X-Start-Epoch", "X-Step-Seconds", NEXT_CURSOR_HEADER, "ETag", "X-Medication-Version", "Server-Timing"],
 )
 
 # Auth secret for cookie signing
 AUTH_SECRET = os.getenv("AUTH_SECRET", secrets.token_hex(32))
 
+# Cache of verified auth tokens, saves the HMAC check and user lookup on every request
+session_cache = SessionCache(
+    max_entries=int(os.getenv("SESSION_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("SESSION_CACHE_TTL", "300")),
+    recheck_seconds=float(os.getenv("SESSION_CACHE_RECHECK_SECONDS", "1")),
+)
+session_cache.watch_user_changes(models.User)
+
+# Per-user settings, versioned for ETags
+settings_cache = SettingsCache()
+
+# Change counters of the data tables, the basis of the list endpoints' ETags
+table_versions = TableVersions()
+
+# Cache for simulated medication levels, keyed by the jab history
+medication_level_cache = MedicationLevelCache(max_entries=int(os.getenv("MEDICATION_CACHE_SIZE", "32")))
+# Band results are up to BAND_MAX_CELLS large, kept apart so they can't push out the level curves
+medication_band_cache = MedicationLevelCache(max_entries=int(os.getenv("MEDICATION_BAND_CACHE_SIZE", "4")))
+trend_cache = TrendCache(max_entries=int(os.getenv("TREND_CACHE_SIZE", "64")))
+
+# Background recompute of the default medication curve after jab writes
+MEDICATION_VERSION_HEADER = "X-Medication-Version"
+medication_precomputer = MedicationPrecomputer(
+    load_jabs=lambda: run_with_session(load_jab_history),
+    workers=int(os.getenv("MEDICATION_PRECOMPUTE_WORKERS", "1")),
+    delay=float(os.getenv("MEDICATION_PRECOMPUTE_DELAY", "0.25")),
+    store=CurveStore() if os.getenv("MEDICATION_PRECOMPUTE_PERSIST", "false").lower() == "true" else None,
+)
+
+# Change events for /api/events streams
+event_broadcaster = EventBroadcaster(
+    queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "100")),
+    heartbeat=float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15")),
+)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -47,13 +160,36 @@ def get_db():
     finally:
         db.close()
 
+# Dependency to get an async DB session (only when DATABASE_ASYNC is enabled)
+async def get_async_db():
+    async with models.AsyncSessionLocal() as db:
+        yield db
+
+def on_data_changed(table: str, op: str = "change", row_id=None, row=None, user_id: int | None = None):
+    """
+    Side effects of a committed write to table, shared by the sync and async handlers.
+    op, row_id and row (ORM row or dict) describe the change for /api/events subscribers.
+    """
+    version = table_versions.bump(table)
+    if table == "jabs":
+        medication_level_cache.invalidate()
+        medication_band_cache.invalidate()
+        medication_precomputer.schedule(version)
+    elif table == "user_settings":
+        settings_cache.bump(user_id)
+    # Settings are private, only the owner's streams see them
+    event_broadcaster.publish(table, op, row_id, row, user_id=user_id if table == "user_settings" else None)
+
 def verify_password(plain_password: str, hashed_password: str, salt: str) -> bool:
     """Verify password with salt."""
     # Hash the password+salt combination with SHA256 first to avoid bcrypt's 72-byte limit
     password_with_salt = hashlib.sha256((plain_password + salt).encode()).digest()
     logger.info(f"Verifying password - SHA256 hash length: {len(password_with_salt)} bytes")
     # bcrypt expects bytes
-    return bcrypt.checkpw(password_with_salt, hashed_password.encode())
+    try:
+        return password_hasher.checkpw(password_with_salt, hashed_password.encode())
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Too many login attempts, try again shortly", headers={"Retry-After": "1"})
 
 def get_password_hash(password: str, salt: str) -> str:
     """Hash password with salt."""
@@ -64,7 +200,10 @@ def get_password_hash(password: str, salt: str) -> str:
     logger.info(f"After SHA256 - Hash length: {len(password_with_salt)} bytes")
 
     # Hash with bcrypt
-    hashed = bcrypt.hashpw(password_with_salt, bcrypt.gensalt())
+    try:
+        hashed = password_hasher.hashpw(password_with_salt)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Too many password operations, try again shortly", headers={"Retry-After": "1"})
     logger.info(f"Successfully hashed password")
     return hashed.decode('utf-8')
 
@@ -83,7 +222,9 @@ def create_auth_token(username: str) -> str:
     ).hexdigest()
     return f"{username}:{timestamp}:{signature}"
 
-def verify_auth_token(token: str, max_age_seconds: int = 60 * 60 * 24 * 360) -> str | None:
+TOKEN_MAX_AGE_SECONDS = 60 * 60 * 24 * 360
+
+def verify_auth_token(token: str, max_age_seconds: int = TOKEN_MAX_AGE_SECONDS) -> str | None:
     """
     Verify HMAC-signed authentication token and return username if valid.
     Returns None if token is invalid or expired.
@@ -138,12 +279,25 @@ class UserCreate(BaseModel):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
+def load_session_users(db: Session) -> list[SessionUser]:
+    rows = db.query(models.User.id, models.User.username, models.User.read_only, models.User.is_active).all()
+    return [SessionUser.from_user(row) for row in rows]
+
 def get_current_user_from_cookie(auth_token: str, db: Session):
-    """Extract and validate user from auth cookie with HMAC verification."""
+    """
+    Extract and validate user from auth cookie with HMAC verification.
+    Returns a SessionUser snapshot; verified tokens are served from session_cache.
+    """
     if not auth_token:
         logger.warning("No auth token provided")
         return None
 
+    # Picks up user changes made outside this process (at most one users SELECT per recheck interval)
+    session_cache.recheck(lambda: load_session_users(db))
+    cached_user = session_cache.get(auth_token)
+    if cached_user is not None:
+        return cached_user
+
     logger.info(f"Validating auth token (length: {len(auth_token)})")
 
     # Verify the token signature
@@ -160,8 +314,13 @@ def get_current_user_from_cookie(auth_token: str, db: Session):
         logger.warning(f"User not found or inactive: {username}")
         return None
 
+    # Cache a snapshot of the user, but never beyond the token's own lifetime
+    session_user = SessionUser.from_user(user)
+    token_valid_for = int(auth_token.split(":")[1]) + TOKEN_MAX_AGE_SECONDS - time.time()
+    session_cache.put(auth_token, session_user, token_valid_for=token_valid_for)
+
     logger.info(f"User authenticated successfully: {username}")
-    return user
+    return session_user
 
 def require_write_access(auth_token: str = Cookie(None), db: Session = Depends(get_db)):
     """Dependency to check if user has write access (not read-only)."""
@@ -179,6 +338,23 @@ def require_auth(auth_token: str = Cookie(None), db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+def conditional_get(*tables: str, user_settings: bool = False):
+    """
+    Dependency for GET endpoints whose response only depends on tables (and the request's
+    query/Accept, plus the current user's settings if user_settings is set). Answers a matching
+    If-None-Match with 304 before any query runs; otherwise the ETag is attached to the
+    response by add_etag_header.
+    """
+    def check_etag(request: Request, current_user: SessionUser = Depends(require_auth)):
+        versions = [f"{table}{table_versions.get(table)}" for table in tables]
+        if user_settings:
+            versions.append(f"settings{current_user.id}-{settings_cache.version(current_user.id)}")
+        etag = make_etag(*versions, request_fingerprint(request))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise NotModified(etag)
+        request.state.etag = etag
+    return Depends(check_etag)
+
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user or not user.is_active:
@@ -261,6 +437,8 @@ def register(user_data: UserCreate, auth_token: str = Cookie(None), db: Session
     )
     db.add(db_user)
     db.commit()
+    # Drop any cached session still pointing at an older account with this name
+    session_cache.invalidate_user(db_user.username)
     db.refresh(db_user)
     return {"success": True, "username": db_user.username}
 
@@ -281,10 +459,46 @@ def get_current_user(auth_token: str = Cookie(None), db: Session = Depends(get_d
         "is_admin": user.username == ADMIN_USER
     }
 
-@app.get("/api/logs")
-def get_all_logs(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
-    """Get all logs. Requires authentication."""
-    return db.query(models.Log).order_by(models.Log.date.asc(), models.Log.time.asc()).all()
+LOG_NUMERIC_FIELDS = ["weight", "body_fat", "muscle", "visceral_fat", "sleep"]
+
+@app.get("/api/auth/session-cache-stats")
+def get_session_cache_stats(current_user: SessionUser = Depends(require_auth)):
+    """Hit-rate and eviction counters of the verified-session cache. Requires authentication."""
+    return session_cache.stats()
+
+@app.get("/api/auth/hash-stats")
+def get_password_hash_stats(current_user: SessionUser = Depends(require_auth)):
+    """Queue wait, hash time and rejection counters of the bcrypt pool. Requires authentication."""
+    return password_hasher.stats()
+
+@app.get("/api/logs", dependencies=[conditional_get("logs")])
+def get_all_logs(
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    format: str | None = None,
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Get all logs. Requires authentication.
+
+    since/until filter by date (inclusive); with limit the result is paged and the
+    X-Next-Cursor header holds the cursor for the next page.
+    format=columnar|binary returns the numeric columns only, format=ndjson|csv streams all rows.
+    """
+    response_format = negotiate_format(format, accept, FORMATS + STREAM_FORMATS)
+    if response_format in STREAM_FORMATS:
+        return stream_tables(["logs"], response_format, since, until, cursor)
+    if response_format != "json":
+        columns = [models.Log.id, models.Log.date, models.Log.time] + [getattr(models.Log, field) for field in LOG_NUMERIC_FIELDS]
+        rows, headers = fetch_page(keyset_query(db.query(*columns), models.Log, since, until, cursor, limit), limit)
+        return rows_response(rows, LOG_NUMERIC_FIELDS, response_format, headers)
+    columns = model_columns(models.Log)
+    rows, headers = fetch_page(keyset_query(db.query(*columns), models.Log, since, until, cursor, limit), limit)
+    return json_rows_response(rows, [column.name for column in columns], headers)
 
 # Pydantic model for request body
 class LogCreate(BaseModel):
@@ -298,7 +512,7 @@ class LogCreate(BaseModel):
     notes: str | None = None
 
 @app.post("/api/logs")
-def create_log(log: LogCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
+def create_log(log: LogCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
     db_log = models.Log(
         date=log.date if log.date else datetime.date.today(),
         time=log.time if log.time else datetime.datetime.now().time(),
@@ -310,40 +524,47 @@ def create_log(log: LogCreate, db: Session = Depends(get_db), user: models.User
         notes=log.notes
     )
     db.add(db_log)
+    rollups.refresh(db, "logs", [db_log.date])
     db.commit()
+    on_data_changed("logs", "create", db_log.id, db_log)
     db.refresh(db_log)
-    return db_log
+    return row_payload(db_log)
 
 @app.put("/api/logs/{log_id}")
-def update_log(log_id: int, log: LogCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_log = db.query(models.Log).filter(models.Log.id == log_id).first()
+def update_log(log_id: int, log: LogCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_log = db.query(models.Log).filter(models.Log.id == log_id, models.Log.deleted == False).first()
     if db_log is None:
         raise HTTPException(status_code=404, detail="Log not found")
 
+    old_date = db_log.date
     for key, value in log.dict(exclude_unset=True).items():
         setattr(db_log, key, value)
 
+    rollups.refresh(db, "logs", [old_date, db_log.date])
     db.commit()
+    on_data_changed("logs", "update", db_log.id, db_log)
     db.refresh(db_log)
-    return db_log
+    return row_payload(db_log)
 
 @app.delete("/api/logs/{log_id}")
-def delete_log(log_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_log = db.query(models.Log).filter(models.Log.id == log_id).first()
+def delete_log(log_id: int, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_log = db.query(models.Log).filter(models.Log.id == log_id, models.Log.deleted == False).first()
     if db_log is None:
         raise HTTPException(status_code=404, detail="Log not found")
 
-    db.delete(db_log)
+    db_log.deleted = True
+    rollups.refresh(db, "logs", [db_log.date])
     db.commit()
+    on_data_changed("logs", "delete", log_id)
     return {"ok": True}
 
-@app.get("/api/logs/last")
-def get_last_log(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
+@app.get("/api/logs/last", dependencies=[conditional_get("logs")])
+def get_last_log(db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
     """Get the last log entry. Requires authentication."""
-    last_log = db.query(models.Log).order_by(models.Log.id.desc()).first()
+    last_log = db.query(models.Log).filter(models.Log.deleted == False).order_by(models.Log.id.desc()).first()
     if last_log is None:
         raise HTTPException(status_code=404, detail="No logs found")
-    return last_log
+    return row_payload(last_log)
 
 # Jab endpoints
 class JabCreate(BaseModel):
@@ -352,13 +573,27 @@ class JabCreate(BaseModel):
     dose: float
     notes: str | None = None
 
-@app.get("/api/jabs")
-def get_all_jabs(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
-    """Get all jab entries. Requires authentication."""
-    return db.query(models.Jab).order_by(models.Jab.date.asc(), models.Jab.time.asc()).all()
+@app.get("/api/jabs", dependencies=[conditional_get("jabs")])
+def get_all_jabs(
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    format: str | None = None,
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """Get all jab entries. Requires authentication. Filtered, paged and streamed like /api/logs."""
+    response_format = negotiate_format(format, accept, ("json",) + STREAM_FORMATS)
+    if response_format in STREAM_FORMATS:
+        return stream_tables(["jabs"], response_format, since, until, cursor)
+    columns = model_columns(models.Jab)
+    rows, headers = fetch_page(keyset_query(db.query(*columns), models.Jab, since, until, cursor, limit), limit)
+    return json_rows_response(rows, [column.name for column in columns], headers)
 
 @app.post("/api/jabs")
-def create_jab(jab: JabCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
+def create_jab(jab: JabCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
     db_jab = models.Jab(
         date=jab.date if jab.date else datetime.date.today(),
         time=jab.time if jab.time else datetime.datetime.now().time(),
@@ -367,12 +602,13 @@ def create_jab(jab: JabCreate, db: Session = Depends(get_db), user: models.User
     )
     db.add(db_jab)
     db.commit()
+    on_data_changed("jabs", "create", db_jab.id, db_jab)
     db.refresh(db_jab)
-    return db_jab
+    return row_payload(db_jab)
 
 @app.put("/api/jabs/{jab_id}")
-def update_jab(jab_id: int, jab: JabCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_jab = db.query(models.Jab).filter(models.Jab.id == jab_id).first()
+def update_jab(jab_id: int, jab: JabCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_jab = db.query(models.Jab).filter(models.Jab.id == jab_id, models.Jab.deleted == False).first()
     if db_jab is None:
         raise HTTPException(status_code=404, detail="Jab not found")
 
@@ -380,55 +616,263 @@ def update_jab(jab_id: int, jab: JabCreate, db: Session = Depends(get_db), user:
         setattr(db_jab, key, value)
 
     db.commit()
+    on_data_changed("jabs", "update", db_jab.id, db_jab)
     db.refresh(db_jab)
-    return db_jab
+    return row_payload(db_jab)
 
 @app.delete("/api/jabs/{jab_id}")
-def delete_jab(jab_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_jab = db.query(models.Jab).filter(models.Jab.id == jab_id).first()
+def delete_jab(jab_id: int, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_jab = db.query(models.Jab).filter(models.Jab.id == jab_id, models.Jab.deleted == False).first()
     if db_jab is None:
         raise HTTPException(status_code=404, detail="Jab not found")
 
-    db.delete(db_jab)
+    db_jab.deleted = True
     db.commit()
+    on_data_changed("jabs", "delete", jab_id)
     return {"ok": True}
 
-@app.get("/api/jabs/last")
-def get_last_jab(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
+@app.get("/api/jabs/last", dependencies=[conditional_get("jabs")])
+def get_last_jab(db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
     """Get the last jab entry. Requires authentication."""
-    last_jab = db.query(models.Jab).order_by(models.Jab.id.desc()).first()
+    last_jab = db.query(models.Jab).filter(models.Jab.deleted == False).order_by(models.Jab.id.desc()).first()
     if last_jab is None:
         raise HTTPException(status_code=404, detail="No jabs found")
-    return last_jab
+    return row_payload(last_jab)
+
+def load_jab_history(db: Session) -> list[dict]:
+    """Ordered (date, time, dose) jab rows; plain rows are enough for the calculator and the cache fingerprint."""
+    jabs = db.query(models.Jab.date, models.Jab.time, models.Jab.dose).filter(models.Jab.deleted == False).order_by(models.Jab.date.asc(), models.Jab.time.asc()).all()
+    return [{"date": jab.date, "time": jab.time, "dose": jab.dose} for jab in jabs]
+
+# Per-user PK parameters are stored as settings "pk_<name>", e.g. pk_ka or pk_CL_apparent
+PK_SETTING_PREFIX = "pk_"
+
+def parse_pk_setting(name: str, raw: str) -> float | None:
+    """The value of pk_<name> setting raw, or None if it is not a usable parameter value."""
+    try:
+        value = float(raw)
+    except ValueError:
+        return None
+    if not 0 < value < float("inf") or (name == "F" and value > 1):
+        return None
+    return value
+
+def check_pk_settings(settings: dict[str, str]):
+    """Reject pk_* settings that are unknown parameters or invalid values (400)."""
+    for key, raw in settings.items():
+        if not key.startswith(PK_SETTING_PREFIX):
+            continue
+        name = key[len(PK_SETTING_PREFIX):]
+        if name not in PKParameters._fields:
+            raise HTTPException(status_code=400, detail=f"Unknown PK parameter, expected one of: {', '.join(PKParameters._fields)}")
+        if parse_pk_setting(name, raw) is None:
+            raise HTTPException(status_code=400, detail=f"{key} must be a positive number" + (" up to 1" if name == "F" else ""))
+
+def user_pk_parameters(db: Session, user_id: int) -> PKParameters:
+    """The user's PK parameter set: DEFAULT_PK_PARAMETERS with the pk_* settings applied."""
+    _, settings = load_user_settings(db, user_id)
+    values = DEFAULT_PK_PARAMETERS._asdict()
+    for name in PKParameters._fields:
+        raw = settings.get(PK_SETTING_PREFIX + name)
+        value = parse_pk_setting(name, raw) if raw is not None else None
+        if value is not None:
+            values[name] = value
+    return PKParameters(**values)
+
+def local_naive(value: datetime.datetime | None) -> datetime.datetime | None:
+    """
+    A query datetime as naive server-local time, the way jab times are stored. Values with an
+    offset are converted to local time first, so ...Z and ...+05:00 mean different instants.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
 
-@app.get("/api/medication-levels")
-def get_medication_levels(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
+def precomputed_medication_levels(stale_ok: bool = False):
+    """
+    The background-computed default curve: the one for the current jab history, or with
+    stale_ok whatever was completed last. None if unavailable; never waits for a recompute.
+    """
+    if stale_ok:
+        return medication_precomputer.latest()
+    return medication_precomputer.current(table_versions.get("jabs"))
+
+@app.get("/api/medication-levels", dependencies=[conditional_get("jabs", user_settings=True)])
+def get_medication_levels(
+    request: Request,
+    response: Response,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = Query(1.0, ge=0.5, description="Sample spacing in hours"),
+    max_points: int | None = Query(None, ge=4, description="Downsample to at most this many points"),
+    format: str | None = None,
+    stale_ok: bool = Query(False, description="Serve the last completed curve right away, even if a recompute is pending"),
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
     """
     Calculate and return medication levels over time based on jab history.
     Requires authentication.
 
-    Returns a list of datetime + medication level values.
+    Optionally restricted to a start/end window, sampled at `resolution` hours and
+    downsampled (min/max bucketing) to `max_points`.
+
+    Returns a list of datetime + medication level values, or with format=columnar|binary
+    (or a matching Accept header) a start_epoch/step_seconds/levels representation.
+
+    Levels use the user's PK parameters (pk_* settings). With the default parameters the default
+    view (no window, hourly, JSON) is served from the curve precomputed after the last jab write,
+    with its jabs version in X-Medication-Version, once it is ready; until then it is computed here.
     """
-    jabs = db.query(models.Jab).order_by(models.Jab.date.asc(), models.Jab.time.asc()).all()
+    response_format = negotiate_format(format, accept)
+    params = user_pk_parameters(db, current_user.id)
+
+    if (params == DEFAULT_PK_PARAMETERS and start is None and end is None and resolution == 1.0
+            and max_points is None and response_format == "json"):
+        curve = precomputed_medication_levels(stale_ok)
+        if curve is not None:
+            response.headers[MEDICATION_VERSION_HEADER] = str(curve.version)
+            if curve.version != table_versions.get("jabs"):
+                # Older than the jabs ETag: don't let the client revalidate against it
+                request.state.etag = None
+                response.headers["Cache-Control"] = "no-store"
+            return curve.levels
+
+    start, end = local_naive(start), local_naive(end)
 
-    if not jabs:
+    jabs_data = load_jab_history(db)
+
+    if not jabs_data and response_format == "json":
         return []
 
-    # Convert SQLAlchemy models to dictionaries for the calculator
-    jabs_data = [
-        {
-            "date": jab.date,
-            "time": jab.time,
-            "dose": jab.dose,
-            "notes": jab.notes
-        }
-        for jab in jabs
+    # Calculate medication levels (served from the cache while the jab history is unchanged)
+    levels = medication_level_cache.get_levels(
+        jabs_data, columns=response_format != "json", params=params,
+        start=start, end=end, resolution=resolution, max_points=max_points
+    )
+
+    if response_format != "json":
+        return medication_levels_response(levels, response_format)
+    return levels
+
+def parse_number_list(value: str, name: str) -> list[float]:
+    try:
+        return [float(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a comma separated list of numbers")
+
+def parse_variability(value: str | None) -> dict[str, float] | None:
+    """"ka=0.4,F=0.1" -> PK_VARIABILITY with those coefficients of variation replaced."""
+    if value is None:
+        return None
+    variability = dict(PK_VARIABILITY)
+    for part in value.split(","):
+        name, _, cv = part.partition("=")
+        name = name.strip()
+        if name not in PK_VARIABILITY:
+            raise HTTPException(status_code=400, detail=f"Unknown PK parameter, expected one of: {', '.join(PK_VARIABILITY)}")
+        try:
+            variability[name] = float(cv)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid coefficient of variation for {name}")
+        if not 0 <= variability[name] <= 2:
+            raise HTTPException(status_code=400, detail=f"Coefficient of variation for {name} must be between 0 and 2")
+    return variability
+
+def load_medication_bands(db: Session, user_id: int, options: dict):
+    """Bands for the jab history with the user's PK parameters, through medication_band_cache."""
+    return medication_band_cache.get_bands(load_jab_history(db), params=user_pk_parameters(db, user_id), **options)
+
+@app.get("/api/medication-levels/bands", dependencies=[conditional_get("jabs", user_settings=True)])
+async def get_medication_level_bands(
+    samples: int = Query(1000, ge=10, le=5000, description="Number of sampled parameter sets"),
+    percentiles: str = "5,50,95",
+    variability: str | None = Query(None, description="Coefficients of variation, e.g. ka=0.4,F=0.1"),
+    seed: int = 0,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = Query(1.0, ge=0.5, description="Sample spacing in hours"),
+    max_points: int | None = Query(None, ge=4, description="Downsample to at most this many points"),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Medication levels with Monte Carlo uncertainty bands: each point of the regular level
+    series also gets p<q> keys (p5, p50, p95 by default) over `samples` simulations with
+    PK parameters sampled log-normally around the user's parameter set. Requires authentication.
+
+    The series is downsampled to at most BAND_MAX_CELLS / samples points (2000 for the default
+    1000 samples), and simulated in the threadpool.
+    """
+    quantiles = parse_number_list(percentiles, "percentiles")
+    if not quantiles or not all(0 <= q <= 100 for q in quantiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    options = dict(
+        samples=samples, percentiles=tuple(quantiles), variability=parse_variability(variability), seed=seed,
+        start=local_naive(start), end=local_naive(end), resolution=resolution, max_points=max_points,
+    )
+    return await run_in_threadpool(run_with_session, load_medication_bands, current_user.id, options)
+
+class DoseSchedule(BaseModel):
+    dose: float = Field(gt=0, description="Dose per jab in mg")
+    interval_days: float = Field(gt=0, le=60)
+    count: int = Field(ge=1, le=104)
+    start: datetime.datetime | None = Field(None, description="First jab of the schedule, default one interval after the last jab")
+
+class ProjectionRequest(BaseModel):
+    schedules: list[DoseSchedule] = Field(min_length=1, max_length=32)
+    resolution: float = Field(1.0, ge=0.5, description="Sample spacing in hours")
+    max_points: int | None = Field(None, ge=4, description="Downsample each curve to at most this many points")
+
+@app.post("/api/medication-levels/projection")
+def project_medication(projection: ProjectionRequest, db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
+    """
+    What-if projection: the jab history continued by each candidate schedule (dose, interval_days,
+    count), simulated together in one batch. Returns the levels plus peak/trough statistics per
+    schedule, and the baseline without further jabs. Requires authentication.
+    """
+    schedules = [
+        {**schedule.dict(), "start": local_naive(schedule.start)}
+        for schedule in projection.schedules
     ]
+    return project_medication_levels(
+        load_jab_history(db), schedules, projection.resolution, projection.max_points,
+        params=user_pk_parameters(db, current_user.id),
+    )
 
-    # Calculate medication levels
-    levels = calculate_medication_levels(jabs_data)
+@app.get("/api/medication-levels/cache-stats")
+def get_medication_cache_stats(current_user: SessionUser = Depends(require_auth)):
+    """Hit/miss counters of the medication level cache. Requires authentication."""
+    return {**medication_level_cache.stats(), "bands": medication_band_cache.stats()}
 
-    return levels
+@app.get("/api/medication-levels/parameters")
+def get_medication_parameters(db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
+    """The PK parameters used for the current user, and the defaults. Set them as pk_<name> settings."""
+    return {
+        "parameters": user_pk_parameters(db, current_user.id)._asdict(),
+        "defaults": DEFAULT_PK_PARAMETERS._asdict(),
+    }
+
+@app.get("/api/medication-levels/precompute-stats")
+def get_medication_precompute_stats(current_user: SessionUser = Depends(require_auth)):
+    """Versions and counters of the background medication curve worker. Requires authentication."""
+    return medication_precomputer.stats()
+
+@app.get("/api/export")
+def export_history(
+    tables: str = ",".join(EXPORT_TABLES),
+    format: str = "ndjson",
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Stream the full history as NDJSON (rows tagged with their table when several are exported)
+    or CSV (one table). Requires authentication.
+    """
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(STREAM_FORMATS)}")
+    return stream_tables([table.strip() for table in tables.split(",") if table.strip()], format, since, until)
 
 # Body Measurement endpoints
 class BodyMeasurementCreate(BaseModel):
@@ -444,13 +888,36 @@ class BodyMeasurementCreate(BaseModel):
     neck: float | None = None
     notes: str | None = None
 
-@app.get("/api/body-measurements")
-def get_all_body_measurements(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
-    """Get all body measurement entries. Requires authentication."""
-    return db.query(models.BodyMeasurement).order_by(models.BodyMeasurement.date.asc(), models.BodyMeasurement.time.asc()).all()
+BODY_MEASUREMENT_NUMERIC_FIELDS = ["upper_arm_left", "upper_arm_right", "chest", "waist", "thigh_left", "thigh_right", "face", "neck"]
+
+@app.get("/api/body-measurements", dependencies=[conditional_get("body_measurements")])
+def get_all_body_measurements(
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    format: str | None = None,
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Get all body measurement entries. Requires authentication. Filtered, paged and streamed like /api/logs.
+    format=columnar|binary returns the numeric columns only, format=ndjson|csv streams all rows.
+    """
+    response_format = negotiate_format(format, accept, FORMATS + STREAM_FORMATS)
+    if response_format in STREAM_FORMATS:
+        return stream_tables(["body_measurements"], response_format, since, until, cursor)
+    if response_format != "json":
+        columns = [models.BodyMeasurement.id, models.BodyMeasurement.date, models.BodyMeasurement.time] + [getattr(models.BodyMeasurement, field) for field in BODY_MEASUREMENT_NUMERIC_FIELDS]
+        rows, headers = fetch_page(keyset_query(db.query(*columns), models.BodyMeasurement, since, until, cursor, limit), limit)
+        return rows_response(rows, BODY_MEASUREMENT_NUMERIC_FIELDS, response_format, headers)
+    columns = model_columns(models.BodyMeasurement)
+    rows, headers = fetch_page(keyset_query(db.query(*columns), models.BodyMeasurement, since, until, cursor, limit), limit)
+    return json_rows_response(rows, [column.name for column in columns], headers)
 
 @app.post("/api/body-measurements")
-def create_body_measurement(measurement: BodyMeasurementCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
+def create_body_measurement(measurement: BodyMeasurementCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
     db_measurement = models.BodyMeasurement(
         date=measurement.date if measurement.date else datetime.date.today(),
         time=measurement.time if measurement.time else datetime.datetime.now().time(),
@@ -465,141 +932,377 @@ def create_body_measurement(measurement: BodyMeasurementCreate, db: Session = De
         notes=measurement.notes
     )
     db.add(db_measurement)
+    rollups.refresh(db, "body_measurements", [db_measurement.date])
     db.commit()
+    on_data_changed("body_measurements", "create", db_measurement.id, db_measurement)
     db.refresh(db_measurement)
-    return db_measurement
+    return row_payload(db_measurement)
 
 @app.put("/api/body-measurements/{measurement_id}")
-def update_body_measurement(measurement_id: int, measurement: BodyMeasurementCreate, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_measurement = db.query(models.BodyMeasurement).filter(models.BodyMeasurement.id == measurement_id).first()
+def update_body_measurement(measurement_id: int, measurement: BodyMeasurementCreate, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_measurement = db.query(models.BodyMeasurement).filter(models.BodyMeasurement.id == measurement_id, models.BodyMeasurement.deleted == False).first()
     if db_measurement is None:
         raise HTTPException(status_code=404, detail="Body measurement not found")
 
+    old_date = db_measurement.date
     for key, value in measurement.dict(exclude_unset=True).items():
         setattr(db_measurement, key, value)
 
+    rollups.refresh(db, "body_measurements", [old_date, db_measurement.date])
     db.commit()
+    on_data_changed("body_measurements", "update", db_measurement.id, db_measurement)
     db.refresh(db_measurement)
-    return db_measurement
+    return row_payload(db_measurement)
 
 @app.delete("/api/body-measurements/{measurement_id}")
-def delete_body_measurement(measurement_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_write_access)):
-    db_measurement = db.query(models.BodyMeasurement).filter(models.BodyMeasurement.id == measurement_id).first()
+def delete_body_measurement(measurement_id: int, db: Session = Depends(get_db), user: SessionUser = Depends(require_write_access)):
+    db_measurement = db.query(models.BodyMeasurement).filter(models.BodyMeasurement.id == measurement_id, models.BodyMeasurement.deleted == False).first()
     if db_measurement is None:
         raise HTTPException(status_code=404, detail="Body measurement not found")
 
-    db.delete(db_measurement)
+    db_measurement.deleted = True
+    rollups.refresh(db, "body_measurements", [db_measurement.date])
     db.commit()
+    on_data_changed("body_measurements", "delete", measurement_id)
     return {"ok": True}
 
-@app.get("/api/body-measurements/last")
-def get_last_body_measurement(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
+@app.get("/api/body-measurements/last", dependencies=[conditional_get("body_measurements")])
+def get_last_body_measurement(db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
     """Get the last body measurement entry. Requires authentication."""
-    last_measurement = db.query(models.BodyMeasurement).order_by(models.BodyMeasurement.id.desc()).first()
+    last_measurement = db.query(models.BodyMeasurement).filter(models.BodyMeasurement.deleted == False).order_by(models.BodyMeasurement.id.desc()).first()
     if last_measurement is None:
         raise HTTPException(status_code=404, detail="No body measurements found")
-    return last_measurement
+    return row_payload(last_measurement)
+
+# Bulk import, the counterpart of /api/export
+IMPORT_SCHEMAS = {"logs": LogCreate, "jabs": JabCreate, "body_measurements": BodyMeasurementCreate}
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def run_import(db: Session, body: str, format: str, table: str | None, skip_invalid: bool):
+    rows = iter_csv(body, table) if format == "csv" else iter_ndjson(body, table)
+    return import_rows(db, rows, IMPORT_SCHEMAS, skip_invalid)
+
+@app.post("/api/import")
+async def import_history(
+    request: Request,
+    format: str | None = None,
+    table: str | None = None,
+    skip_invalid: bool = False,
+    user: SessionUser = Depends(require_write_access)
+):
+    """
+    Import rows from an NDJSON (rows may carry their table, as /api/export writes them) or CSV
+    (one table) body. format defaults from the Content-Type. Invalid rows are reported by line;
+    unless skip_invalid, any invalid row means nothing is imported (400).
+    """
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of: {', '.join(STREAM_FORMATS)}")
+    if table is not None and table not in IMPORT_SCHEMAS:
+        raise HTTPException(status_code=400, detail=f"Unknown table: {table}")
+    if format == "csv" and table is None:
+        raise HTTPException(status_code=400, detail="CSV import needs a table")
+    if int(request.headers.get("content-length") or 0) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Import too large")
+    body = await request.body()
+    if len(body) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Import too large")
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import must be UTF-8")
+
+    result = await run_in_threadpool(run_with_session, run_import, text, format, table, skip_invalid)
+    if result["error_count"] and not skip_invalid:
+        raise HTTPException(status_code=400, detail=result)
+    for imported_table, count in result["inserted"].items():
+        if count:
+            on_data_changed(imported_table, "import")
+    return result
+
+# Delta sync for offline clients, see sync.py
+SYNC_OVERLAP = datetime.timedelta(seconds=float(os.getenv("SYNC_OVERLAP_SECONDS", "10")))
+# Deleted rows are kept as tombstones this long, clients that last synced earlier resync fully
+SYNC_TOMBSTONE_RETENTION = datetime.timedelta(days=float(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30")))
+SYNC_PURGE_INTERVAL = datetime.timedelta(hours=float(os.getenv("SYNC_PURGE_INTERVAL_HOURS", "6")))
+
+async def purge_tombstones_periodically():
+    """Purge tombstones older than SYNC_TOMBSTONE_RETENTION now and every SYNC_PURGE_INTERVAL."""
+    while True:
+        try:
+            purged = await run_in_threadpool(run_with_session, purge_tombstones, models.utcnow() - SYNC_TOMBSTONE_RETENTION)
+            if purged:
+                logger.info(f"Purged {purged} sync tombstones older than {SYNC_TOMBSTONE_RETENTION.total_seconds() / 86400:g} days")
+        except Exception:
+            logger.exception("Purging sync tombstones failed")
+        await asyncio.sleep(SYNC_PURGE_INTERVAL.total_seconds())
+
+@app.get("/api/sync")
+def sync_history(since: str | None = None, db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
+    """
+    Rows of every table and the user's settings changed or deleted since the sync token
+    (everything without one), plus the token to pass next time. A token older than the
+    tombstone retention gets a full sync. Requires authentication.
+    """
+    return sync_changes(db, current_user.id, since, SYNC_OVERLAP, SYNC_TOMBSTONE_RETENTION)
+
+@app.get("/api/events")
+async def stream_events(db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
+    """
+    Server-sent events: a "change" event ({"table", "op", "id", "row"}) after every committed
+    write, heartbeats in between. Authenticated once, when the stream opens.
+    """
+    # The session was only needed for the auth check, don't hold its connection for the stream's lifetime
+    db.close()
+    subscriber = event_broadcaster.subscribe(current_user.id)
+    return StreamingResponse(
+        event_broadcaster.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/events/stats")
+def get_event_stats(current_user: SessionUser = Depends(require_auth)):
+    """Subscriber and event counters of the /api/events broadcaster. Requires authentication."""
+    return event_broadcaster.stats()
+
+@app.get("/api/metrics")
+def get_metrics(authorization: str | None = Header(None), auth_token: str = Cookie(None), db: Session = Depends(get_db)):
+    """
+    Request, latency and database metrics in the Prometheus text format. Requires authentication,
+    or "Authorization: Bearer <METRICS_TOKEN>" for scrapers when METRICS_TOKEN is set.
+    """
+    scraper = METRICS_TOKEN and authorization and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+    if not scraper:
+        require_auth(auth_token, db)
+    return Response(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Aggregated endpoints: one request, one auth check, sections loaded concurrently
+DASHBOARD_SECTIONS = ("logs", "jabs", "body_measurements", "medication_levels")
+LATEST_SECTIONS = ("logs", "jabs", "body_measurements")
+SECTION_MODELS = {"logs": models.Log, "jabs": models.Jab, "body_measurements": models.BodyMeasurement}
+
+def parse_sections(fields: str | None, available: tuple[str, ...]) -> list[str]:
+    if fields is None:
+        return list(available)
+    sections = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [section for section in sections if section not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return sections
+
+def run_with_session(fn, *args):
+    """Run fn(db, *args) with its own session, so sections can run in parallel threads."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+def load_section_rows(db: Session, section: str, since, until):
+    model = SECTION_MODELS[section]
+    columns = model_columns(model)
+    return row_dicts(keyset_query(db.query(*columns), model, since, until).all(), [column.name for column in columns])
+
+def load_section_last(db: Session, section: str):
+    model = SECTION_MODELS[section]
+    row = db.query(model).filter(model.deleted == False).order_by(model.id.desc()).first()
+    return row_payload(row) if row is not None else None
+
+def load_medication_section(db: Session, user_id: int, resolution: float, max_points: int | None):
+    params = user_pk_parameters(db, user_id)
+    if params == DEFAULT_PK_PARAMETERS and resolution == 1.0 and max_points is None:
+        curve = precomputed_medication_levels()
+        if curve is not None:
+            return curve.levels
+    jabs_data = load_jab_history(db)
+    if not jabs_data:
+        return []
+    return medication_level_cache.get_levels(jabs_data, params=params, resolution=resolution, max_points=max_points)
+
+@app.get("/api/dashboard", dependencies=[conditional_get("logs", "jabs", "body_measurements", user_settings=True)])
+async def get_dashboard(
+    fields: str | None = None,
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    resolution: float = Query(1.0, ge=0.5),
+    max_points: int | None = Query(None, ge=4),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Everything the stats page renders in one document: logs, jabs, body_measurements and
+    medication_levels, each as returned by its own endpoint. fields=logs,jabs,... limits
+    the sections, since/until filter the lists, resolution/max_points shape the medication curve.
+    """
+    sections = parse_sections(fields, DASHBOARD_SECTIONS)
+    tasks = []
+    for section in sections:
+        if section == "medication_levels":
+            tasks.append(run_in_threadpool(run_with_session, load_medication_section, current_user.id, resolution, max_points))
+        else:
+            tasks.append(run_in_threadpool(run_with_session, load_section_rows, section, since, until))
+    # Sections are plain rows already, skip FastAPI's jsonable_encoder pass
+    return FastJSONResponse(dict(zip(sections, await asyncio.gather(*tasks))))
+
+@app.get("/api/latest", dependencies=[conditional_get("logs", "jabs", "body_measurements")])
+async def get_latest(fields: str | None = None, current_user: SessionUser = Depends(require_auth)):
+    """The last log, jab and body measurement in one document (null where there is none yet)."""
+    sections = parse_sections(fields, LATEST_SECTIONS)
+    rows = await asyncio.gather(*(run_in_threadpool(run_with_session, load_section_last, section) for section in sections))
+    return dict(zip(sections, rows))
+
+# Trend lines (server-side counterpart of calculateMovingAverage in chartUtils.js)
+TREND_METRICS = {
+    **{field: ("logs", models.Log) for field in LOG_NUMERIC_FIELDS},
+    **{field: ("body_measurements", models.BodyMeasurement) for field in BODY_MEASUREMENT_NUMERIC_FIELDS},
+}
+
+@app.get("/api/trends", dependencies=[conditional_get("logs", "body_measurements")])
+def get_trends(
+    metrics: str,
+    bandwidth: float = Query(0.43, gt=0, le=1),
+    projection_days: int = Query(3, ge=0, le=365),
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    LOWESS trend line per metric (comma separated), aligned with the rows of the metric's list
+    endpoint for the same since/until and followed by projection_days projected values.
+    """
+    trends = {}
+    for metric in parse_sections(metrics, tuple(TREND_METRICS)):
+        table, model = TREND_METRICS[metric]
+        key = (metric, table_versions.get(table), since, until, bandwidth, projection_days)
+
+        def compute():
+            values = keyset_query(db.query(getattr(model, metric)), model, since, until).all()
+            return lowess_trend([value for value, in values], bandwidth, projection_days)
+
+        trends[metric] = trend_cache.get_or_compute(key, compute)
+    return trends
+
+@app.get("/api/trends/cache-stats")
+def get_trend_cache_stats(current_user: SessionUser = Depends(require_auth)):
+    """Hit/miss counters of the trend cache. Requires authentication."""
+    return trend_cache.stats()
+
+@app.get("/api/rollups", dependencies=[conditional_get("logs", "body_measurements")])
+def get_rollups(
+    metric: str,
+    granularity: str = "day",
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Daily or ISO-weekly (granularity=day|week) count/min/max/mean/last of one Log or body measurement
+    metric, read from the rollup table. Week buckets are labelled with their Monday.
+    """
+    if metric not in rollups.ROLLUP_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric, expected one of: {', '.join(rollups.ROLLUP_METRICS)}")
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown granularity, expected one of: {', '.join(rollups.GRANULARITIES)}")
+    return [row._asdict() for row in rollups.read_rollups(db, metric, granularity, since, until)]
 
 class SettingUpdate(BaseModel):
     setting_key: str
     setting_value: str
 
+def load_user_settings(db: Session, user_id: int) -> tuple[int, dict[str, str]]:
+    """(version, settings) for user_id, served from settings_cache when it is current."""
+    version, settings = settings_cache.get(user_id)
+    if settings is None:
+        rows = db.query(models.UserSettings.setting_key, models.UserSettings.setting_value).filter(
+            models.UserSettings.user_id == user_id, models.UserSettings.deleted == False
+        ).all()
+        settings = {key: value for key, value in rows}
+        settings_cache.put(user_id, version, settings)
+    return version, settings
+
 @app.get("/api/settings")
-def get_user_settings(db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
-    """Get all settings for the current user. Returns a dict of key-value pairs."""
-    settings = db.query(models.UserSettings).filter(models.UserSettings.user_id == current_user.id).all()
-    return {setting.setting_key: setting.setting_value for setting in settings}
+def get_user_settings(
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+    current_user: SessionUser = Depends(require_auth)
+):
+    """
+    Get all settings for the current user. Returns a dict of key-value pairs.
+    Carries an ETag and answers a matching If-None-Match with 304.
+    """
+    version, settings = load_user_settings(db, current_user.id)
+    etag = make_etag("settings", current_user.id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return settings
 
 @app.get("/api/settings/{setting_key}")
-def get_user_setting(setting_key: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_auth)):
+def get_user_setting(setting_key: str, db: Session = Depends(get_db), current_user: SessionUser = Depends(require_auth)):
     """Get a specific setting for the current user."""
-    setting = db.query(models.UserSettings).filter(
-        models.UserSettings.user_id == current_user.id,
-        models.UserSettings.setting_key == setting_key
-    ).first()
+    _, settings = load_user_settings(db, current_user.id)
 
-    if setting is None:
+    if setting_key not in settings:
         raise HTTPException(status_code=404, detail="Setting not found")
 
-    return {"setting_key": setting.setting_key, "setting_value": setting.setting_value}
+    return {"setting_key": setting_key, "setting_value": settings[setting_key]}
 
 @app.put("/api/settings/{setting_key}")
 def update_user_setting(
     setting_key: str,
     setting_update: SettingUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_auth)
+    current_user: SessionUser = Depends(require_auth)
 ):
     """Update or create a setting for the current user. Authorized users (including read-only) can update settings."""
-    # Find existing setting
-    setting = db.query(models.UserSettings).filter(
-        models.UserSettings.user_id == current_user.id,
-        models.UserSettings.setting_key == setting_key
-    ).first()
-
-    if setting:
-        # Update existing setting
-        setting.setting_value = setting_update.setting_value
-    else:
-        # Create new setting
-        setting = models.UserSettings(
-            user_id=current_user.id,
-            setting_key=setting_key,
-            setting_value=setting_update.setting_value
-        )
-        db.add(setting)
-
+    check_pk_settings({setting_key: setting_update.setting_value})
+    db.execute(models.upsert_settings_statement(
+        db.bind.dialect.name, current_user.id, {setting_key: setting_update.setting_value}
+    ))
     db.commit()
-    db.refresh(setting)
-    return {"setting_key": setting.setting_key, "setting_value": setting.setting_value}
+    on_data_changed("user_settings", "upsert", setting_key, {setting_key: setting_update.setting_value}, user_id=current_user.id)
+    return {"setting_key": setting_key, "setting_value": setting_update.setting_value}
 
 @app.post("/api/settings")
 def batch_update_settings(
     settings: dict[str, str],
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_auth)
+    current_user: SessionUser = Depends(require_auth)
 ):
-    """Batch update multiple settings for the current user."""
-    updated_settings = {}
-
-    for key, value in settings.items():
-        # Find existing setting
-        setting = db.query(models.UserSettings).filter(
-            models.UserSettings.user_id == current_user.id,
-            models.UserSettings.setting_key == key
-        ).first()
-
-        if setting:
-            setting.setting_value = value
-        else:
-            setting = models.UserSettings(
-                user_id=current_user.id,
-                setting_key=key,
-                setting_value=value
-            )
-            db.add(setting)
-
-        updated_settings[key] = value
-
-    db.commit()
-    return updated_settings
+    """Batch update multiple settings for the current user, as a single upsert statement."""
+    check_pk_settings(settings)
+    if settings:
+        db.execute(models.upsert_settings_statement(db.bind.dialect.name, current_user.id, settings))
+        db.commit()
+        on_data_changed("user_settings", "upsert", row=settings, user_id=current_user.id)
+    return dict(settings)
 
 @app.delete("/api/settings/{setting_key}")
 def delete_user_setting(
     setting_key: str,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_auth)
+    current_user: SessionUser = Depends(require_auth)
 ):
     """Delete a setting for the current user."""
     setting = db.query(models.UserSettings).filter(
         models.UserSettings.user_id == current_user.id,
-        models.UserSettings.setting_key == setting_key
+        models.UserSettings.setting_key == setting_key,
+        models.UserSettings.deleted == False
     ).first()
 
     if setting is None:
         raise HTTPException(status_code=404, detail="Setting not found")
 
-    db.delete(setting)
+    setting.deleted = True
     db.commit()
+    on_data_changed("user_settings", "delete", setting_key, user_id=current_user.id)
     return {"ok": True}
 
+# Async database path: swap the CRUD and settings handlers for their async versions
+if models.DATABASE_ASYNC:
+    import async_routes
+    async_routes.install(app)
@@ -6,9 +6,15 @@ To be honest, I have no idea what I'm doing here
 but I tuned it so it matches some graphs from other apps / sources.
 """
 import datetime
-from typing import List, Dict, Any
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, NamedTuple
 import numpy as np
 from scipy.integrate import odeint
+from scipy.linalg import expm
+from scipy.signal import fftconvolve
 
 
 # ------------------------------------------------------
@@ -22,6 +28,33 @@ ka = 0.0373            # h^-1 (absorption rate constant)
 F = 0.62               # bioavailability (solution formulation)
 Vdss_reported = 10.3   # L (reported steady-state volume)
 
+
+class PKParameters(NamedTuple):
+    """One PK parameter set; hashable, so it can key the model caches below."""
+    F: float
+    ka: float
+    CL_apparent: float
+    Vc: float
+    Q: float
+    Vp: float
+    Vdss_reported: float
+
+
+DEFAULT_PK_PARAMETERS = PKParameters(F, ka, CL_apparent, Vc, Q, Vp, Vdss_reported)
+
+# Parameter sets whose model artefacts (eigen decomposition, unit response) are kept
+MODEL_CACHE_SIZE = 32
+
+# Largest eigenvector condition number the modal engines are used with. Their error grows
+# with it (about cond * 1e-16 of the peak level); when ka comes close to one of the
+# disposition eigenvalues the system matrix is nearly defective and the matrix exponential
+# is evaluated directly instead.
+MODAL_CONDITION_LIMIT = 1e6
+
+# Tolerances of the odeint reference engine, tight enough to check the other engines against
+ODEINT_RTOL = 1e-11
+ODEINT_ATOL = 1e-12
+
 # ------------------------------------------------------
 # ODEs: absorption → central ↔ peripheral
 # ------------------------------------------------------
@@ -34,35 +67,520 @@ def tzp_odes(y, t, ka, CL_apparent, Vc, Q, Vp):
 
 
 # ------------------------------------------------------
-# Simulation function
+# Simulation engines
 # ------------------------------------------------------
-def simulate(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14):
+def _engine_output(t, A, Vc):
+    """What every engine returns for its (len(t), 3) states: (t, A_total, A_c, A_p, Cc in ng/mL)."""
+    A_c, A_p = A[:, 1], A[:, 2]
+    return t, A_c + A_p, A_c, A_p, (A_c / Vc) * 1000.0
+
+
+def simulate_odeint(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14):
+    """
+    Reference engine: integrate the ODEs numerically with odeint, from dose to dose.
+
+    Samples the same instants as the other engines: doses enter the absorption depot at their
+    exact timestamps, and a grid point t is the state at t, including every dose with td <= t.
+    (The original stepper stored the state at t + dt and snapped doses to the grid, which put
+    its curve half a sample late.)
+    """
+    t_end = max(td for _, td in doses) + extra_days_after_last*24
+    t = np.arange(0, t_end+dt, dt)
+    A = np.zeros((len(t), 3))
+    args = (ka, CL_apparent, Vc, Q, Vp)
+
+    dose_times = {}
+    for D, td in doses:
+        dose_times[td] = dose_times.get(td, 0.0) + D
+    dose_schedule = sorted(dose_times.items())
+
+    y = np.zeros(3)
+    t_prev = dose_schedule[0][0]
+    for k, (td, D) in enumerate(dose_schedule):
+        if td > t_prev:
+            y = odeint(tzp_odes, y, [t_prev, td], args=args, rtol=ODEINT_RTOL, atol=ODEINT_ATOL)[-1]
+        y[0] += F * D
+        t_prev = td
+
+        t_next = dose_schedule[k + 1][0] if k + 1 < len(dose_schedule) else np.inf
+        i0, i1 = np.searchsorted(t, [td, t_next], side="left")
+        if i0 == i1:
+            continue
+        # odeint returns the initial state as its first row
+        A[i0:i1, :] = odeint(tzp_odes, y, np.concatenate(([td], t[i0:i1])), args=args, rtol=ODEINT_RTOL, atol=ODEINT_ATOL)[1:]
+
+    return _engine_output(t, A, Vc)
+
+
+def _system_matrix(ka, CL_apparent, Vc, Q, Vp):
+    """The (linear) system matrix K of tzp_odes, dy/dt = K y."""
+    return np.array([
+        [-ka, 0.0, 0.0],
+        [ka, -(CL_apparent + Q) / Vc, Q / Vp],
+        [0.0, Q / Vc, -Q / Vp],
+    ])
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _modal_decomposition(ka, CL_apparent, Vc, Q, Vp):
+    """
+    Eigen-decompose the (linear) system matrix of tzp_odes.
+
+    With K = V diag(lam) V^-1 the transition matrix over any interval tau is
+    V diag(exp(lam * tau)) V^-1, so we only have to do this once per parameter set.
+    Only usable when modal_form_usable() says so.
+    """
+    lam, V = np.linalg.eig(_system_matrix(ka, CL_apparent, Vc, Q, Vp))
+    # all eigenvalues of this system are real and negative
+    try:
+        V_inv = np.linalg.inv(V.real)
+    except np.linalg.LinAlgError:
+        V_inv = np.full((3, 3), np.nan)
+    return lam.real, V.real, V_inv
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def modal_form_usable(ka, CL_apparent, Vc, Q, Vp) -> bool:
+    """Whether the eigenvectors are well enough conditioned for the modal engines."""
+    _, V, V_inv = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+    return bool(np.isfinite(V_inv).all() and np.linalg.cond(V) < MODAL_CONDITION_LIMIT)
+
+
+def _expm_states(doses, t, F, ka, CL_apparent, Vc, Q, Vp):
+    """
+    State (A_gut, A_c, A_p) at times t (hours) for doses [(D, td)], shape (len(t), 3),
+    from the matrix exponential; valid for any parameter set, including nearly defective ones.
+
+    The state right after each dose is carried forward dose to dose, and every t is evaluated
+    as expm(K * tau) applied to the state after the last dose at or before it. Only the
+    distinct offsets tau are exponentiated.
+    """
+    K = _system_matrix(ka, CL_apparent, Vc, Q, Vp)
+    A = np.zeros((len(t), 3))
+    if not doses:
+        return A
+    dose_totals = {}
+    for D, td in doses:
+        dose_totals[td] = dose_totals.get(td, 0.0) + D
+    dose_times = np.array(sorted(dose_totals))
+
+    after_dose = np.zeros((len(dose_times), 3))
+    y = np.zeros(3)
+    for j, td in enumerate(dose_times):
+        if j > 0:
+            y = expm(K * (td - dose_times[j - 1])) @ y
+        y[0] += F * dose_totals[td]
+        after_dose[j] = y
+
+    last_dose = np.searchsorted(dose_times, t, side="right") - 1
+    dosed = np.flatnonzero(last_dose >= 0)
+    if len(dosed) == 0:
+        return A
+    tau = t[dosed] - dose_times[last_dose[dosed]]
+    offsets, which = np.unique(np.round(tau, 6), return_inverse=True)
+    transitions = expm(offsets[:, None, None] * K)
+    A[dosed] = np.einsum("tij,tj->ti", transitions[which], after_dose[last_dose[dosed]])
+    return A
+
+
+def simulate_matrix(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14):
+    """
+    Closed-form engine: propagate the state analytically over the whole time grid.
+
+    Between two doses the state is y(t) = Phi(t - t_dose) y(t_dose), which is evaluated
+    for all grid points of that interval at once. Doses are applied at their exact
+    timestamps, so a grid point t sees every dose with td <= t.
+    """
     t_end = max(td for _, td in doses) + extra_days_after_last*24
     t = np.arange(0, t_end+dt, dt)
     A = np.zeros((len(t), 3))
-    y = [0.0, 0.0, 0.0]
-    doses_applied = set()  # Track which doses have been applied
-
-    for i, ti in enumerate(t):
-        # add doses at this time (into absorption depot)
-        for D, td in doses:
-            # Check if this dose should be applied at this time point and hasn't been applied yet
-            if abs(ti - td) <= (dt/2.0) and td not in doses_applied:
-                y[0] += F * D
-                doses_applied.add(td)
-        # integrate one step
-        sol = odeint(tzp_odes, y, [ti, ti+dt], args=(ka, CL_apparent, Vc, Q, Vp))
-        y = sol[-1].tolist()
-        A[i,:] = y
-
-    A_gut, A_c, A_p = A[:,0], A[:,1], A[:,2]
-    A_total = A_c + A_p
-    # central concentration (ng/mL)
-    Cc_ng_per_mL = (A_c / Vc) * 1000.0
-    return t, A_total, A_c, A_p, Cc_ng_per_mL
-
-
-def calculate_medication_levels(jabs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    lam, V, V_inv = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+
+    # merge doses given at the same moment and walk them in time order
+    dose_times = {}
+    for D, td in doses:
+        dose_times[td] = dose_times.get(td, 0.0) + D
+    dose_schedule = sorted(dose_times.items())
+
+    y = np.zeros(3)
+    t_prev = dose_schedule[0][0]
+    for k, (td, D) in enumerate(dose_schedule):
+        # carry the state forward to this dose and add it to the absorption depot
+        y = V @ (np.exp(lam * (td - t_prev)) * (V_inv @ y))
+        y[0] += F * D
+        t_prev = td
+
+        t_next = dose_schedule[k + 1][0] if k + 1 < len(dose_schedule) else np.inf
+        i0, i1 = np.searchsorted(t, [td, t_next], side="left")
+        if i0 == i1:
+            continue
+        tau = t[i0:i1] - td
+        A[i0:i1, :] = (np.exp(np.outer(tau, lam)) * (V_inv @ y)) @ V.T
+
+    return _engine_output(t, A, Vc)
+
+
+# unit responses keyed by (ka, CL_apparent, Vc, Q, Vp, dt), least recently used first
+_unit_responses = OrderedDict()
+_unit_responses_lock = threading.Lock()
+
+
+def unit_response(ka, CL_apparent, Vc, Q, Vp, dt, n):
+    """
+    Modal unit impulse response: exp(lam_k * m * dt) for m = 0..n-1, shape (n, 3).
+
+    Together with the mode-to-compartment weights from _unit_weights this is the state
+    after a 1 mg dose in the absorption depot. Computed lazily per parameter set and dt,
+    and only extended when a longer history needs it; the MODEL_CACHE_SIZE most recently
+    used parameter sets are kept.
+    """
+    key = (ka, CL_apparent, Vc, Q, Vp, dt)
+    with _unit_responses_lock:
+        E = _unit_responses.get(key)
+        if E is not None:
+            _unit_responses.move_to_end(key)
+    if E is None or len(E) < n:
+        lam, _, _ = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+        E = np.exp(np.outer(np.arange(n) * dt, lam))
+        with _unit_responses_lock:
+            _unit_responses[key] = E
+            _unit_responses.move_to_end(key)
+            while len(_unit_responses) > MODEL_CACHE_SIZE:
+                _unit_responses.popitem(last=False)
+    return E[:n]
+
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _unit_weights(ka, CL_apparent, Vc, Q, Vp):
+    """Weights M so that a unit dose gives y(tau) = M @ exp(lam * tau)."""
+    _, V, V_inv = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+    return V * V_inv[:, 0]
+
+
+def _modal_impulses(D, td, lam, dt, F):
+    """Grid index of the first sample at or after td and the modal impulse F*D*exp(lam*delta)."""
+    j = int(np.ceil(td / dt - 1e-9))
+    delta = j * dt - td
+    return j, F * D * np.exp(lam * delta)
+
+
+def add_dose(A, t, D, td, F, ka, CL_apparent, Vc, Q, Vp):
+    """
+    Add a single dose to an existing (len(t), 3) state array in place.
+
+    Superposition makes this an O(curve length) update instead of a full re-simulation.
+    """
+    if not modal_form_usable(ka, CL_apparent, Vc, Q, Vp):
+        A += _expm_states([(D, td)], t, F, ka, CL_apparent, Vc, Q, Vp)
+        return A
+    dt = t[1] - t[0] if len(t) > 1 else 0.5
+    lam, _, _ = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+    j, w = _modal_impulses(D, td - t[0], lam, dt, F)
+    j = max(j, 0)
+    if j >= len(t):
+        return A
+    E = unit_response(ka, CL_apparent, Vc, Q, Vp, dt, len(t) - j)
+    A[j:, :] += (E * w) @ _unit_weights(ka, CL_apparent, Vc, Q, Vp).T
+    return A
+
+
+def _superposition_states(doses, F, ka, CL_apparent, Vc, Q, Vp, dt, extra_days_after_last):
+    """Time grid and (len(t), 3) state array of simulate_superposition."""
+    t_end = max(td for _, td in doses) + extra_days_after_last*24
+    t = np.arange(0, t_end+dt, dt)
+    n = len(t)
+    lam, _, _ = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+
+    impulses = np.zeros((n, 3))
+    for D, td in doses:
+        j, w = _modal_impulses(D, td, lam, dt, F)
+        if j < n:
+            impulses[max(j, 0), :] += w
+
+    E = unit_response(ka, CL_apparent, Vc, Q, Vp, dt, n)
+    modes = fftconvolve(impulses, E, axes=0)[:n]
+    # FFT round-off can leave tiny negative values where there is no drug yet
+    return t, np.maximum(modes @ _unit_weights(ka, CL_apparent, Vc, Q, Vp).T, 0.0)
+
+
+def simulate_superposition(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14):
+    """
+    Superposition engine: convolve a dose impulse train with the cached unit response.
+
+    The model is linear and time-invariant, so the curve is a sum of shifted, scaled unit
+    responses. Each mode is convolved separately, and a dose that falls between two grid
+    points enters its impulse pre-decayed by exp(lam * delta), which keeps dose timing exact.
+    """
+    t, A = _superposition_states(doses, F, ka, CL_apparent, Vc, Q, Vp, dt, extra_days_after_last)
+
+    return _engine_output(t, A, Vc)
+
+
+def simulate_expm(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14):
+    """
+    Matrix exponential engine: like simulate_matrix, without the eigen decomposition.
+
+    Slower, but exact for every parameter set; simulate() falls back to it when the modal
+    form is ill-conditioned.
+    """
+    t_end = max(td for _, td in doses) + extra_days_after_last*24
+    t = np.arange(0, t_end+dt, dt)
+    A = _expm_states(doses, t, F, ka, CL_apparent, Vc, Q, Vp)
+
+    return _engine_output(t, A, Vc)
+
+
+ENGINES = {
+    "superposition": simulate_superposition,
+    "matrix": simulate_matrix,
+    "expm": simulate_expm,
+    "odeint": simulate_odeint,
+}
+# Engines built on the eigen decomposition, replaced by "expm" where it is ill-conditioned
+MODAL_ENGINES = ("superposition", "matrix")
+DEFAULT_ENGINE = "superposition"
+
+
+def simulate(doses, F, ka, CL_apparent, Vc, Q, Vp, dt=0.5, extra_days_after_last=14, engine=DEFAULT_ENGINE):
+    """Run the PK simulation with the selected engine ("superposition", "matrix", "expm" or the "odeint" reference)."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown simulation engine: {engine}")
+    if engine in MODAL_ENGINES and not modal_form_usable(ka, CL_apparent, Vc, Q, Vp):
+        engine = "expm"
+    return ENGINES[engine](doses, F, ka, CL_apparent, Vc, Q, Vp, dt=dt, extra_days_after_last=extra_days_after_last)
+
+
+# Parameter set / grid combinations whose last simulated states are kept for add_dose
+STATE_CACHE_SIZE = 4
+
+
+class StateSeriesCache:
+    """
+    Last simulated state series per (params, dt, extra days), for incremental updates.
+
+    A new jab is nearly always later than every earlier one. When the requested doses are
+    the cached doses plus later ones, the cached states are extended with their free decay
+    up to the new end of the grid and each new dose is added with add_dose, which is
+    O(curve length) instead of a full re-simulation. Any other change (an edited, deleted or
+    back-dated jab) simulates from scratch. Only used where the modal form is usable.
+    Per process: the precompute worker keeps its own.
+    """
+
+    def __init__(self, max_entries: int = STATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.extensions = 0
+        self.simulations = 0
+
+    def states(self, doses, p: PKParameters, dt: float = 0.5, extra_days_after_last=14):
+        """Time grid and (len(t), 3) states for doses [(D, td)] with parameters p; both read-only."""
+        doses = tuple(doses)
+        key = (p, dt, extra_days_after_last)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == doses:
+            with self._lock:
+                self.hits += 1
+            return entry[1], entry[2]
+
+        if entry is not None and self._extends(entry[0], doses):
+            cached_doses, t_old, A_old = entry
+            t_end = max(td for _, td in doses) + extra_days_after_last*24
+            t = np.arange(0, t_end+dt, dt)
+            A = np.empty((len(t), 3))
+            A[:len(t_old)] = A_old
+            A[len(t_old):] = _free_decay(A_old[-1], t[len(t_old):] - t_old[-1], p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp)
+            for D, td in doses[len(cached_doses):]:
+                add_dose(A, t, D, td, p.F, p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp)
+            counter = "extensions"
+        else:
+            t, A = _superposition_states(doses, p.F, p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp, dt, extra_days_after_last)
+            counter = "simulations"
+        t.flags.writeable = False
+        A.flags.writeable = False
+
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self._entries[key] = (doses, t, A)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return t, A
+
+    @staticmethod
+    def _extends(cached_doses, doses) -> bool:
+        """Whether doses are cached_doses followed by doses no earlier than any of them."""
+        added = doses[len(cached_doses):]
+        return (bool(cached_doses) and bool(added) and doses[:len(cached_doses)] == cached_doses
+                and min(td for _, td in added) >= max(td for _, td in cached_doses))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "extensions": self.extensions,
+                "simulations": self.simulations,
+            }
+
+
+def _free_decay(y, tau, ka, CL_apparent, Vc, Q, Vp):
+    """States reached from y after the offsets tau (hours) without further doses, shape (len(tau), 3)."""
+    lam, V, V_inv = _modal_decomposition(ka, CL_apparent, Vc, Q, Vp)
+    return (np.exp(np.outer(tau, lam)) * (V_inv @ y)) @ V.T
+
+
+state_series_cache = StateSeriesCache()
+
+
+def medication_level_series(jabs: List[Dict[str, Any]], engine: str = DEFAULT_ENGINE, dt: float = 0.5,
+                            params: PKParameters | None = None):
+    """
+    Simulate the jab history with params (default: DEFAULT_PK_PARAMETERS) and return the raw level series.
+
+    Returns:
+        (first_jab_datetime, t, level): t in hours since the first jab on a dt grid,
+        level the literature-style amount in mg at each t.
+    """
+    # Convert jabs to doses_list format: (dose in mg, time in hours since first dose)
+    first_jab_datetime = datetime.datetime.combine(jabs[0]["date"], jabs[0]["time"])
+
+    doses_list = []
+    for jab in jabs:
+        jab_datetime = datetime.datetime.combine(jab["date"], jab["time"])
+        hours_since_first = (jab_datetime - first_jab_datetime).total_seconds() / 3600
+        doses_list.append((jab["dose"], hours_since_first))
+
+    # Run simulation
+    p = params or DEFAULT_PK_PARAMETERS
+    if engine == "superposition" and modal_form_usable(p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp):
+        t, A = state_series_cache.states(doses_list, p, dt=dt)
+        t, _, _, _, Cc = _engine_output(t, A, p.Vc)
+    else:
+        t, _, _, _, Cc = simulate(doses_list, p.F, p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp, dt=dt, engine=engine)
+
+    # compute literature-style amount as time series
+    A_lit = Cc / 1000.0 * p.Vdss_reported  # mg
+
+    return first_jab_datetime, t, A_lit
+
+
+def downsample_minmax(y, max_points: int):
+    """
+    Shape-preserving downsampling by min/max bucketing.
+
+    Splits y into equal buckets and keeps the minimum and maximum of each, plus the
+    first and last sample, so peaks and troughs survive. Returns sorted indices into y,
+    at most max_points of them.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(1, (max_points - 2) // 2)
+    size = -(-n // buckets)  # ceil
+    padded = np.pad(y, (0, buckets * size - n), mode="edge").reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    idx = np.concatenate((
+        [0, n - 1],
+        offsets + padded.argmin(axis=1),
+        offsets + padded.argmax(axis=1),
+    ))
+    return np.unique(np.minimum(idx, n - 1))
+
+
+def medication_level_view(
+    jabs: List[Dict[str, Any]],
+    engine: str = DEFAULT_ENGINE,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = 1.0,
+    max_points: int | None = None,
+    params: PKParameters | None = None,
+):
+    """
+    Simulate and cut the level series down to the requested window and resolution.
+
+    Returns (first_jab_datetime, t, level) like medication_level_series.
+    """
+    dt = 0.5
+    first_jab_datetime, t, A_lit = medication_level_series(jabs, engine=engine, dt=dt, params=params)
+
+    # sample to the requested resolution (1-hr intervals by default)
+    step = max(1, int(round(resolution / dt)))
+    t, A_lit = t[::step], A_lit[::step]
+
+    # restrict to the requested time window
+    if start is not None or end is not None:
+        t_start = (start - first_jab_datetime).total_seconds() / 3600 if start is not None else -np.inf
+        t_stop = (end - first_jab_datetime).total_seconds() / 3600 if end is not None else np.inf
+        i0 = np.searchsorted(t, t_start, side="left")
+        i1 = np.searchsorted(t, t_stop, side="right")
+        t, A_lit = t[i0:i1], A_lit[i0:i1]
+
+    if max_points is not None:
+        keep = downsample_minmax(A_lit, max_points)
+        t, A_lit = t[keep], A_lit[keep]
+
+    return first_jab_datetime, t, A_lit
+
+
+def medication_level_columns(
+    jabs: List[Dict[str, Any]],
+    engine: str = DEFAULT_ENGINE,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = 1.0,
+    max_points: int | None = None,
+    params: PKParameters | None = None,
+) -> Dict[str, Any]:
+    """
+    Columnar variant of calculate_medication_levels, built straight from the NumPy arrays.
+
+    Returns a dict with:
+        - start_epoch: first sample as seconds since 1970-01-01, with the (naive) jab
+          wall-clock time read as UTC
+        - step_seconds: spacing of the samples, or None if downsampling made it irregular
+        - offset_seconds: int32 array of sample offsets from start_epoch (only when irregular)
+        - level: float32 array of levels in mg
+    """
+    empty = {"start_epoch": None, "step_seconds": None, "offset_seconds": None, "level": np.zeros(0, dtype=np.float32)}
+    if not jabs:
+        return empty
+
+    first_jab_datetime, t, A_lit = medication_level_view(jabs, engine, start, end, resolution, max_points, params)
+    if len(t) == 0:
+        return empty
+
+    first_epoch = first_jab_datetime.replace(tzinfo=datetime.timezone.utc).timestamp()
+    offsets = np.rint((t - t[0]) * 3600).astype(np.int32)
+    steps = np.diff(offsets)
+    if len(steps) == 0:
+        step_seconds = int(round(resolution * 3600))
+    elif (steps == steps[0]).all():
+        step_seconds = int(steps[0])
+    else:
+        step_seconds = None
+
+    return {
+        "start_epoch": float(first_epoch + t[0] * 3600),
+        "step_seconds": step_seconds,
+        "offset_seconds": offsets if step_seconds is None else None,
+        "level": np.round(A_lit, 2).astype(np.float32),
+    }
+
+
+def calculate_medication_levels(
+    jabs: List[Dict[str, Any]],
+    engine: str = DEFAULT_ENGINE,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = 1.0,
+    max_points: int | None = None,
+    params: PKParameters | None = None,
+) -> List[Dict[str, Any]]:
     """
     Calculate medication levels over time based on injection history.
 
@@ -72,6 +590,12 @@ def calculate_medication_levels(jabs: List[Dict[str, Any]]) -> List[Dict[str, An
             - time: datetime.time
             - dose: float (in mg)
             - notes: str (optional)
+        engine: simulation engine, "superposition" (default), "matrix" (closed form) or "odeint" (reference)
+        start: only return levels at or after this (naive, local) datetime
+        end: only return levels at or before this (naive, local) datetime
+        resolution: spacing of the returned samples in hours (multiple of the 0.5 h simulation step)
+        max_points: if set, downsample the window to at most this many points (min/max bucketing)
+        params: PK parameter set, default DEFAULT_PK_PARAMETERS
 
     Returns:
         List of dictionaries with:
@@ -89,37 +613,380 @@ def calculate_medication_levels(jabs: List[Dict[str, Any]]) -> List[Dict[str, An
     if not jabs:
         return []
 
-    # Convert jabs to doses_list format: (dose in mg, time in hours since first dose)
-    first_jab_datetime = datetime.datetime.combine(jabs[0]["date"], jabs[0]["time"])
-
-    doses_list = []
-    for jab in jabs:
-        jab_datetime = datetime.datetime.combine(jab["date"], jab["time"])
-        hours_since_first = (jab_datetime - first_jab_datetime).total_seconds() / 3600
-        doses_list.append((jab["dose"], hours_since_first))
-
-    # Run simulation
-    t, A_total, A_c, A_p, Cc = simulate(doses_list, F, ka, CL_apparent, Vc, Q, Vp)
-
-    Cmax = Cc.max()                     # ng/mL
-    A_total_peak = A_total.max()        # mg
-    Cmax_mg_per_L = Cmax / 1000.0
-    amount_from_Cmax = Cmax_mg_per_L * Vdss_reported
-    Veff_at_peak = A_total_peak / Cmax_mg_per_L
+    first_jab_datetime, t, A_lit = medication_level_view(jabs, engine, start, end, resolution, max_points, params)
 
-    # compute literature-style amount as time series
-    A_lit = Cc / 1000.0 * Vdss_reported  # mg
-
-    # Prepare output with datetime and mg (amount_from_Cmax)
+    # Prepare output with datetime and mg (amount_from_Cmax), as plain Python floats so the
+    # response encodes without numpy scalars
     output = [] # list of dicts with datetime and level (mg)
-    for ti, Ai in zip(t, A_lit):
+    for ti, Ai in zip(t.tolist(), np.round(A_lit, 2).tolist()):
         current_datetime = first_jab_datetime + datetime.timedelta(hours=ti)
         output.append({
             "datetime": current_datetime.isoformat(),
-            "level": round(Ai, 2)
+            "level": Ai
+        })
+
+    return output
+
+
+# ------------------------------------------------------
+# What-if projections
+# ------------------------------------------------------
+def _batched_impulses(n, dt, lam, F, series, dose_hours, doses, out):
+    """Add the modal impulses of doses (hours since t0) of each series into out (series, n, 3)."""
+    j = np.ceil(dose_hours / dt - 1e-9).astype(int)
+    w = F * doses[:, None] * np.exp(np.outer(j * dt - dose_hours, lam))
+    keep = (j >= 0) & (j < n)
+    np.add.at(out, (series[keep], j[keep]), w[keep])
+
+
+def project_medication_levels(
+    jabs: List[Dict[str, Any]],
+    schedules: List[Dict[str, Any]],
+    resolution: float = 1.0,
+    max_points: int | None = None,
+    dt: float = 0.5,
+    extra_days_after_last: int = 14,
+    params: PKParameters | None = None,
+) -> Dict[str, Any]:
+    """
+    Project the levels of the jab history continued by each of several candidate schedules.
+
+    Each schedule has dose (mg), interval_days, count and an optional start (naive datetime,
+    default: one interval after the last jab). The model is linear, so the history and all
+    candidates share one time grid and one unit response: their impulse trains are stacked
+    into a (1 + len(schedules), n, 3) array and convolved in a single batched FFT.
+
+    Returns {"baseline": levels without further jabs, "schedules": [...]}, where each schedule
+    entry repeats its parameters and adds its levels plus peak and trough (over the dosing
+    period, first dose until one interval after the last) and final_peak / final_trough (last
+    interval only). All levels start at the earliest candidate start.
+    """
+    if jabs:
+        history = [(datetime.datetime.combine(jab["date"], jab["time"]), jab["dose"]) for jab in jabs]
+        last_jab_datetime = history[-1][0]
+    else:
+        history = []
+        last_jab_datetime = datetime.datetime.now().replace(second=0, microsecond=0)
+
+    starts = [
+        schedule.get("start") or last_jab_datetime + datetime.timedelta(days=schedule["interval_days"])
+        for schedule in schedules
+    ]
+    t0 = min([when for when, _ in history] + starts)
+
+    def hours(when):
+        return (when - t0).total_seconds() / 3600
+
+    # Series 0 is the history, series 1 + s the doses of schedule s
+    series, dose_hours, doses = [0] * len(history), [hours(when) for when, _ in history], [dose for _, dose in history]
+    windows = []
+    for s, (schedule, start) in enumerate(zip(schedules, starts), start=1):
+        interval = schedule["interval_days"] * 24
+        first = hours(start)
+        for k in range(schedule["count"]):
+            series.append(s)
+            dose_hours.append(first + k * interval)
+            doses.append(schedule["dose"])
+        windows.append((first, first + schedule["count"] * interval))
+
+    t_end = max(dose_hours) + extra_days_after_last * 24
+    t = np.arange(0, t_end + dt, dt)
+    n = len(t)
+    p = params or DEFAULT_PK_PARAMETERS
+    model = (p.ka, p.CL_apparent, p.Vc, p.Q, p.Vp)
+    if modal_form_usable(*model):
+        lam, _, _ = _modal_decomposition(*model)
+
+        impulses = np.zeros((len(schedules) + 1, n, 3))
+        _batched_impulses(n, dt, lam, p.F, np.array(series), np.array(dose_hours, dtype=float), np.array(doses, dtype=float), impulses)
+
+        E = unit_response(*model, dt, n)
+        modes = fftconvolve(impulses, E[None, :, :], axes=1)[:, :n]
+        # Central compartment only, as the literature-style amount of medication_level_series
+        A_c = np.maximum(modes @ _unit_weights(*model)[1], 0.0)
+    else:
+        A_c = np.array([
+            _expm_states([(D, td) for k, D, td in zip(series, doses, dose_hours) if k == s], t, p.F, *model)[:, 1]
+            for s in range(len(schedules) + 1)
+        ])
+    levels = A_c[0] + A_c[1:]
+    baseline = A_c[0]
+    scale = p.Vdss_reported / p.Vc
+    levels, baseline = levels * scale, baseline * scale
+
+    # Stats on the full dt grid, output sampled at resolution from the earliest candidate start
+    stats = []
+    for (first, stop), schedule, curve in zip(windows, schedules, levels):
+        interval = schedule["interval_days"] * 24
+        i0, i1 = np.searchsorted(t, [first, stop], side="left")
+        f0 = np.searchsorted(t, stop - interval, side="left")
+        window, final = curve[i0:i1 + 1], curve[f0:i1 + 1]
+        stats.append({
+            "peak": {"datetime": (t0 + datetime.timedelta(hours=float(t[i0 + window.argmax()]))).isoformat(), "level": round(float(window.max()), 2)},
+            "trough": {"datetime": (t0 + datetime.timedelta(hours=float(t[i0 + window.argmin()]))).isoformat(), "level": round(float(window.min()), 2)},
+            "final_peak": round(float(final.max()), 2),
+            "final_trough": round(float(final.min()), 2),
         })
 
-    # sample to 1-hr intervals for output
-    output_sampled = [entry for i, entry in enumerate(output) if i % 2 == 0]
+    step = max(1, int(round(resolution / dt)))
+    i_start = np.searchsorted(t, min(first for first, _ in windows), side="left")
+    sample = np.arange(i_start, n, step)
+
+    # The candidates share the sample times, so format the timestamps only once
+    stamps = np.array([(t0 + datetime.timedelta(hours=float(ti))).isoformat() for ti in t[sample]], dtype=object)
+
+    def view(curve):
+        keep = np.arange(len(sample)) if max_points is None else downsample_minmax(curve[sample], max_points)
+        values = np.round(curve[sample[keep]], 2).tolist()
+        return [{"datetime": stamp, "level": value} for stamp, value in zip(stamps[keep].tolist(), values)]
+
+    return {
+        "baseline": view(baseline),
+        "schedules": [
+            {
+                "dose": schedule["dose"],
+                "interval_days": schedule["interval_days"],
+                "count": schedule["count"],
+                "start": start.isoformat(),
+                "levels": view(curve),
+                **schedule_stats,
+            }
+            for schedule, start, curve, schedule_stats in zip(schedules, starts, levels, stats)
+        ],
+    }
+
+
+# ------------------------------------------------------
+# Uncertainty bands
+# ------------------------------------------------------
+# Between-subject variability of the PK parameters: coefficient of variation of a
+# log-normal distribution whose median is the typical value above (F is capped at 1)
+PK_VARIABILITY = {
+    "CL_apparent": 0.25,
+    "Vc": 0.25,
+    "Vp": 0.30,
+    "Q": 0.30,
+    "ka": 0.30,
+    "F": 0.10,
+}
+
+# Sample times evaluated at once per batch, bounds the (samples, chunk, 3) working arrays
+BAND_CHUNK = 1024
+# Upper bound on samples x time points of one bands request; longer series are downsampled
+# (min/max bucketing) to BAND_MAX_CELLS // samples points
+BAND_MAX_CELLS = 2_000_000
+
+
+def sample_pk_parameters(samples: int, variability: Dict[str, float] | None = None, seed: int = 0,
+                         params: PKParameters | None = None) -> Dict[str, np.ndarray]:
+    """
+    Draw samples parameter sets around params (default DEFAULT_PK_PARAMETERS); parameters
+    missing from variability keep their typical value.
+    """
+    variability = PK_VARIABILITY if variability is None else variability
+    p = params or DEFAULT_PK_PARAMETERS
+    typical = {"CL_apparent": p.CL_apparent, "Vc": p.Vc, "Vp": p.Vp, "Q": p.Q, "ka": p.ka, "F": p.F}
+    rng = np.random.default_rng(seed)
+    params = {}
+    for name, value in typical.items():
+        cv = variability.get(name, 0.0)
+        sigma = np.sqrt(np.log1p(cv * cv))
+        params[name] = value * np.exp(rng.normal(0.0, sigma, samples)) if cv > 0 else np.full(samples, value)
+    params["F"] = np.minimum(params["F"], 1.0)
+    return params
+
+
+def simulate_central_batch(doses, t, params: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Central compartment amount at times t (hours) for every parameter set in params, shape (len(t), samples).
+
+    The system matrices of all parameter sets are eigen-decomposed in one batched call. The
+    modal state is carried from dose to dose, and every sample time is evaluated in closed
+    form from the state after the last dose before it, so t may be irregular.
+    """
+    ka_, cl, vc, q, vp, f = (params[name] for name in ("ka", "CL_apparent", "Vc", "Q", "Vp", "F"))
+    samples = len(ka_)
+    K = np.zeros((samples, 3, 3))
+    K[:, 0, 0] = -ka_
+    K[:, 1, 0] = ka_
+    K[:, 1, 1] = -(cl + q) / vc
+    K[:, 1, 2] = q / vp
+    K[:, 2, 1] = q / vc
+    K[:, 2, 2] = -q / vp
+    lam, V = np.linalg.eig(K)
+    lam, V = lam.real, V.real
+    # Nearly defective sets (ka close to a disposition eigenvalue) are simulated with expm below
+    ill_conditioned = np.flatnonzero(~(np.linalg.cond(V) < MODAL_CONDITION_LIMIT))
+    V[ill_conditioned] = np.eye(3)
+    V_inv = np.linalg.inv(V)
+    impulse = V_inv[:, :, 0]  # modal coordinates of a unit dose into the absorption depot
+    central = V[:, 1, :]  # central amount of each mode
+
+    dose_times = np.array(sorted(td for _, td in doses))
+    dose_amounts = np.array([D for D, _ in sorted(doses, key=lambda dose: dose[1])])
+
+    # weighted[j] is the modal state right after dose j, weighted by each mode's central amount
+    weighted = np.zeros((len(dose_times), samples, 3))
+    z = np.zeros((samples, 3))
+    t_prev = dose_times[0]
+    for j, (td, D) in enumerate(zip(dose_times, dose_amounts)):
+        z = z * np.exp(lam * (td - t_prev)) + (f * D)[:, None] * impulse
+        weighted[j] = z * central
+        t_prev = td
+
+    # Time-major, so that per-time percentiles work on contiguous rows
+    A_c = np.zeros((len(t), samples))
+    last_dose = np.searchsorted(dose_times, t, side="right") - 1
+    for start in range(0, len(t), BAND_CHUNK):
+        stop = min(start + BAND_CHUNK, len(t))
+        idx = last_dose[start:stop]
+        dosed = np.flatnonzero(idx >= 0)
+        if len(dosed) == 0:
+            continue
+        tau = t[start:stop][dosed] - dose_times[idx[dosed]]
+        # On a regular grid with regular dosing the same offsets from the last dose keep
+        # coming back, so only exponentiate the distinct ones
+        offsets, which = np.unique(np.round(tau, 6), return_inverse=True)
+        decay = np.exp(offsets[:, None, None] * lam[None, :, :])
+        A_c[start + dosed] = np.einsum("csk,csk->cs", weighted[idx[dosed]], decay[which])
+    for s in ill_conditioned:
+        A_c[:, s] = _expm_states(doses, t, f[s], ka_[s], cl[s], vc[s], q[s], vp[s])[:, 1]
+    return np.maximum(A_c, 0.0)
+
+
+def _row_percentiles(values: np.ndarray, percentiles) -> np.ndarray:
+    """np.percentile(values, percentiles, axis=1) (linear method); a full row sort beats numpy's multi-kth partition here."""
+    ordered = np.sort(values, axis=1)
+    position = np.asarray(percentiles, dtype=float) / 100 * (values.shape[1] - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, values.shape[1] - 1)
+    fraction = position - lower
+    return (ordered[:, lower] * (1 - fraction) + ordered[:, upper] * fraction).T
+
+
+def medication_level_bands(
+    jabs: List[Dict[str, Any]],
+    samples: int = 1000,
+    percentiles=(5, 50, 95),
+    variability: Dict[str, float] | None = None,
+    seed: int = 0,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    resolution: float = 1.0,
+    max_points: int | None = None,
+    params: PKParameters | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    calculate_medication_levels plus Monte Carlo percentile bands: each point gets a
+    "p<q>" key per percentile, taken over samples simulations with parameters drawn by
+    sample_pk_parameters. The same seed gives the same bands. At most BAND_MAX_CELLS // samples
+    points are returned, whatever max_points asks for.
+    """
+    if not jabs:
+        return []
+
+    max_points = min(max_points or BAND_MAX_CELLS, max(4, BAND_MAX_CELLS // samples))
+
+    first_jab_datetime, t, A_lit = medication_level_view(jabs, start=start, end=end, resolution=resolution, max_points=max_points, params=params)
+    doses = [
+        (jab["dose"], (datetime.datetime.combine(jab["date"], jab["time"]) - first_jab_datetime).total_seconds() / 3600)
+        for jab in jabs
+    ]
+    sampled = sample_pk_parameters(samples, variability, seed, params)
+    levels = simulate_central_batch(doses, t, sampled) * ((params or DEFAULT_PK_PARAMETERS).Vdss_reported / sampled["Vc"])
+    bands = np.round(_row_percentiles(levels, percentiles), 2)
+
+    names = [f"p{q:g}" for q in percentiles]
+    output = []
+    for i, (ti, Ai) in enumerate(zip(t, A_lit)):
+        point = {"datetime": (first_jab_datetime + datetime.timedelta(hours=float(ti))).isoformat(), "level": round(float(Ai), 2)}
+        for name, band in zip(names, bands):
+            point[name] = float(band[i])
+        output.append(point)
+    return output
+
+
+# ------------------------------------------------------
+# Result cache
+# ------------------------------------------------------
+def pk_parameters() -> PKParameters:
+    """The default PK parameter set the levels are calculated with (part of the cache key)."""
+    return DEFAULT_PK_PARAMETERS
+
+
+def jab_fingerprint(jabs: List[Dict[str, Any]], params=None, engine: str = DEFAULT_ENGINE) -> str:
+    """Hash of the ordered (date, time, dose) rows plus the PK parameter set and engine."""
+    h = hashlib.sha256()
+    h.update(repr((params if params is not None else pk_parameters(), engine)).encode())
+    for jab in jabs:
+        h.update(f"{jab['date']}|{jab['time']}|{jab['dose']!r};".encode())
+    return h.hexdigest()
+
+
+class MedicationLevelCache:
+    """
+    Bounded LRU cache for calculate_medication_levels (and medication_level_bands) results.
+
+    Entries are keyed by jab_fingerprint, so a stale entry can never be served for a
+    different jab history; invalidate() is still called on jab writes to free memory.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_levels(self, jabs: List[Dict[str, Any]], engine: str = DEFAULT_ENGINE, columns: bool = False,
+                   params: PKParameters | None = None, **view):
+        """
+        Cached calculate_medication_levels (or medication_level_columns if columns is set);
+        view holds the start/end/resolution/max_points arguments.
+        """
+        key = (jab_fingerprint(jabs, params, engine), columns, tuple(sorted(view.items())))
+        calculate = medication_level_columns if columns else calculate_medication_levels
+        return self._get(key, lambda: calculate(jabs, engine=engine, params=params, **view))
+
+    def get_bands(self, jabs: List[Dict[str, Any]], params: PKParameters | None = None, **options):
+        """Cached medication_level_bands; options holds its other keyword arguments."""
+        key = (jab_fingerprint(jabs, params), "bands", repr(sorted(options.items())))
+        return self._get(key, lambda: medication_level_bands(jabs, params=params, **options))
+
+    def _get(self, key, calculate):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        levels = calculate()
+
+        with self._lock:
+            self._entries[key] = levels
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return levels
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
 
-    return output_sampled
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
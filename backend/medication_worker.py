@@ -0,0 +1,166 @@
+"""
+Background precompute of the default medication level curve.
+
+Jab writes call schedule() with the new jabs table version. A single background thread
+waits a short coalescing delay, reads the jab history once and simulates it on a small
+process pool (so the NumPy/SciPy work does not compete with request threads for the GIL).
+Edits that arrive while a curve is being computed only raise the requested version, so a
+burst of edits costs one extra recompute at most. The finished curve is kept in memory
+and, if a CurveStore is given, persisted so a restart can reuse it without simulating.
+Readers never wait for it: until the curve for the current version is ready they compute
+the levels themselves, the worker only warms the cache.
+"""
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import models
+from medication_calculator import calculate_medication_levels, jab_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PrecomputedCurve:
+    version: int  # jabs table version the curve was computed for
+    fingerprint: str
+    levels: List[Dict[str, Any]]
+
+
+class CurveStore:
+    """Keeps the most recent curve in the medication_curves table."""
+
+    def load(self, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        db = models.SessionLocal()
+        try:
+            row = db.get(models.MedicationCurve, fingerprint)
+            return json.loads(row.levels) if row is not None else None
+        finally:
+            db.close()
+
+    def save(self, fingerprint: str, levels: List[Dict[str, Any]]):
+        db = models.SessionLocal()
+        try:
+            db.query(models.MedicationCurve).delete()
+            db.add(models.MedicationCurve(fingerprint=fingerprint, levels=json.dumps(levels)))
+            db.commit()
+        finally:
+            db.close()
+
+
+class MedicationPrecomputer:
+    def __init__(self, load_jabs: Callable[[], List[Dict[str, Any]]], workers: int = 1,
+                 delay: float = 0.25, store: Optional[CurveStore] = None):
+        """
+        load_jabs returns the current jab history (it runs on the worker thread, with its own
+        session). workers=0 simulates on the worker thread instead of a process pool.
+        """
+        self.load_jabs = load_jabs
+        self.workers = workers
+        self.delay = delay
+        self.store = store
+        self._executor = None
+        self._thread = None
+        self._condition = threading.Condition()
+        self._requested = -1
+        self._finished = -1
+        self._latest: Optional[PrecomputedCurve] = None
+        self._closed = False
+        self.computed = 0
+        self.reused = 0
+        self.failed = 0
+
+    def schedule(self, version: int):
+        """Ask for a curve for jabs table version (or newer)."""
+        with self._condition:
+            if self._closed or version <= self._requested:
+                return
+            self._requested = version
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="medication-precompute", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def latest(self) -> Optional[PrecomputedCurve]:
+        with self._condition:
+            return self._latest
+
+    def current(self, version: int) -> Optional[PrecomputedCurve]:
+        """The completed curve if it was computed for version, else None; never waits."""
+        with self._condition:
+            if self._latest is not None and self._latest.version == version:
+                return self._latest
+            return None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn, not fork: the server process has threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _compute(self, jabs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.workers > 0:
+            return self._get_executor().submit(calculate_medication_levels, jabs).result()
+        return calculate_medication_levels(jabs)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._requested > self._finished or self._closed)
+                if self._closed:
+                    return
+            # Let a burst of edits settle, then compute once for the newest version
+            time.sleep(self.delay)
+            with self._condition:
+                version = self._requested
+
+            started = time.perf_counter()
+            curve = None
+            try:
+                jabs = self.load_jabs()
+                fingerprint = jab_fingerprint(jabs)
+                levels = self.store.load(fingerprint) if self.store is not None else None
+                if levels is not None:
+                    self.reused += 1
+                else:
+                    levels = self._compute(jabs)
+                    self.computed += 1
+                    if self.store is not None:
+                        self.store.save(fingerprint, levels)
+                curve = PrecomputedCurve(version, fingerprint, levels)
+                logger.info(f"Medication curve for jabs version {version}: {len(levels)} points in {(time.perf_counter() - started) * 1000:.1f} ms")
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Precomputing the medication curve for jabs version {version} failed")
+
+            with self._condition:
+                if curve is not None:
+                    self._latest = curve
+                self._finished = max(self._finished, version)
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "requested_version": self._requested,
+                "latest_version": self._latest.version if self._latest is not None else None,
+                "computed": self.computed,
+                "reused": self.reused,
+                "failed": self.failed,
+            }
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,215 @@
+"""
+Request and database instrumentation.
+
+instrument_engine() hooks before/after_cursor_execute on an engine. Each statement is
+timed and added to the current request's RequestTiming (found through a context variable,
+which run_in_threadpool and call_next carry over). Statements slower than the slow-query
+threshold are logged, optionally with the database's query plan. The metrics middleware in
+main.py starts a RequestTiming per request and records the latency in a per-route histogram
+along with the request's query count and DB time. It also sends them back in a
+Server-Timing header. Metrics.render() writes everything in the Prometheus text format.
+
+Latencies are measured until the response headers are ready, so streamed responses (export,
+server-sent events) count their time to first byte.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Longest statement text written to the slow-query log
+MAX_LOGGED_STATEMENT = 2000
+
+
+class RequestTiming:
+    """Database work done on behalf of one request, possibly from several threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+
+current_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("current_timing", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, slow_query_seconds: float = 0.1, explain_slow_queries: bool = False,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.slow_query_seconds = slow_query_seconds
+        self.explain_slow_queries = explain_slow_queries
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._route_queries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._route_db_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+
+    # Database side
+
+    def instrument_engine(self, engine):
+        """Time every statement run on engine (a sync Engine, or an AsyncEngine's sync_engine)."""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        timing = current_timing.get()
+        if timing is not None:
+            timing.add_query(elapsed)
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += elapsed
+            slow = elapsed >= self.slow_query_seconds
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            self._log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+    def _log_slow_query(self, conn, statement: str, parameters, executemany: bool, elapsed: float):
+        text = re.sub(r"\s+", " ", statement).strip()[:MAX_LOGGED_STATEMENT]
+        plan = ""
+        if self.explain_slow_queries and not executemany and text.upper().startswith("SELECT"):
+            plan = self._query_plan(conn, statement, parameters)
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms): {text}{plan}")
+
+    def _query_plan(self, conn, statement: str, parameters) -> str:
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(prefix + statement, parameters)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as exc:
+            return f"\n  (no query plan: {exc})"
+        # SQLite rows are (id, parent, notused, detail), Postgres rows are one text column
+        return "".join("\n  " + str(row[-1]) for row in rows)
+
+    # Request side
+
+    def start_request(self) -> Tuple[RequestTiming, contextvars.Token]:
+        timing = RequestTiming()
+        return timing, current_timing.set(timing)
+
+    def finish_request(self, timing: RequestTiming, token: contextvars.Token, method: str, route: str, status: int) -> float:
+        """Record a finished request, returns its duration in seconds."""
+        current_timing.reset(token)
+        elapsed = time.perf_counter() - timing.started
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, status)] += 1
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+            self._route_queries[key] += timing.queries
+            self._route_db_seconds[key] += timing.db_seconds
+        return elapsed
+
+    @staticmethod
+    def server_timing(timing: RequestTiming, elapsed: float) -> str:
+        """Server-Timing header value: database time and query count, and the total."""
+        queries = f"{timing.queries} {'query' if timing.queries == 1 else 'queries'}"
+        return f'db;dur={timing.db_seconds * 1000:.1f};desc="{queries}", total;dur={elapsed * 1000:.1f}'
+
+    # Exposition
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines: List[str] = [
+                "# HELP http_requests_total Requests by method, route and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+            lines += [
+                "# HELP http_request_duration_seconds Time until the response headers were ready.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self._latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+                lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+                lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {_number(histogram.sum)}")
+                lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {histogram.count}")
+
+            lines += [
+                "# HELP http_request_db_queries_total Database statements run for requests, by route.",
+                "# TYPE http_request_db_queries_total counter",
+            ]
+            for (method, route), count in sorted(self._route_queries.items()):
+                lines.append(f"http_request_db_queries_total{_labels(method=method, route=route)} {count}")
+            lines += [
+                "# HELP http_request_db_seconds_total Database time spent for requests, by route.",
+                "# TYPE http_request_db_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self._route_db_seconds.items()):
+                lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {_number(seconds)}")
+
+            lines += [
+                "# HELP db_queries_total Database statements run, including background work.",
+                "# TYPE db_queries_total counter",
+                f"db_queries_total {self.queries}",
+                "# HELP db_query_seconds_total Time spent in database statements.",
+                "# TYPE db_query_seconds_total counter",
+                f"db_query_seconds_total {_number(self.db_seconds)}",
+                "# HELP db_slow_queries_total Statements slower than the slow-query threshold.",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries}",
+            ]
+        return "\n".join(lines) + "\n"
@@ -1,16 +1,110 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, Time, Boolean, UniqueConstraint
+from sqlalchemy import create_engine, event, inspect, text, false, update, Column, Integer, String, Float, Date, Time, DateTime, Boolean, Text, UniqueConstraint, Index
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import datetime
 import os
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./data/database.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite storage profile, applied to every new connection.
+# "performance" (default): WAL journal so reads keep going while a write commits, relaxed fsync,
+# memory-mapped I/O and a bigger page cache. "default" leaves SQLite's own settings alone.
+# Each pragma can be overridden with its SQLITE_* environment variable.
+SQLITE_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": str(256 * 1024 * 1024),
+        "cache_size": str(-64 * 1024),  # negative = KiB, i.e. 64 MiB
+        "temp_store": "MEMORY",
+        "busy_timeout": "5000",  # ms
+    },
+    "default": {},
+}
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "performance")
+SQLITE_PRAGMAS = dict(SQLITE_PROFILES.get(SQLITE_PROFILE, SQLITE_PROFILES["performance"]))
+for pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"):
+    if os.environ.get(f"SQLITE_{pragma.upper()}"):
+        SQLITE_PRAGMAS[pragma] = os.environ[f"SQLITE_{pragma.upper()}"]
+
+# Explicit connection pool (in-memory SQLite keeps SQLAlchemy's single-connection pool)
+POOL_OPTIONS = {} if IS_SQLITE_MEMORY else {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.environ.get("DB_POOL_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+    "pool_pre_ping": not IS_SQLITE,
+}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        # journal_mode=WAL cannot be set on in-memory databases, SQLite just ignores it
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **POOL_OPTIONS
+)
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Optional async engine for the async request handlers (see async_routes.py)
+DATABASE_ASYNC = os.environ.get("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **POOL_OPTIONS)
+    if IS_SQLITE:
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def storage_report() -> dict:
+    """The storage settings actually in effect, read back from a pooled connection."""
+    report = {"database": engine.url.render_as_string(hide_password=True), "pool": engine.pool.status()}
+    if IS_SQLITE:
+        report["profile"] = SQLITE_PROFILE
+        with engine.connect() as connection:
+            for pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"):
+                report[pragma] = connection.execute(text(f"PRAGMA {pragma}")).scalar()
+    return report
+
 Base = declarative_base()
 
-class Log(Base):
+def utcnow() -> datetime.datetime:
+    """Naive UTC timestamp, the format of the updated_at columns."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class SyncColumns:
+    """
+    Change tracking for /api/sync: updated_at is set on every insert and update, and deletes
+    only set deleted (a tombstone) so clients can learn about them. Read paths must skip
+    deleted rows.
+    """
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=True)
+    deleted = Column(Boolean, default=False, server_default=false(), nullable=False)
+
+# Bookkeeping columns returned by /api/sync only, never in the regular row payloads
+SYNC_ONLY_COLUMNS = ("updated_at", "deleted")
+
+class Log(SyncColumns, Base):
     __tablename__ = "logs"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -23,7 +117,13 @@ class Log(Base):
     sleep = Column(Float, nullable=True)
     notes = Column(String, nullable=True)
 
-class Jab(Base):
+    # Ordered (date, time) scans and date ranges are index range reads
+    __table_args__ = (
+        Index('ix_logs_date_time', 'date', 'time'),
+        Index('ix_logs_updated_at', 'updated_at'),
+    )
+
+class Jab(SyncColumns, Base):
     __tablename__ = "jabs"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -32,7 +132,12 @@ class Jab(Base):
     dose = Column(Float, nullable=False)  # dose in mg
     notes = Column(String, nullable=True)
 
-class BodyMeasurement(Base):
+    __table_args__ = (
+        Index('ix_jabs_date_time', 'date', 'time'),
+        Index('ix_jabs_updated_at', 'updated_at'),
+    )
+
+class BodyMeasurement(SyncColumns, Base):
     __tablename__ = "body_measurements"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -48,6 +153,11 @@ class BodyMeasurement(Base):
     neck = Column(Float, nullable=True)
     notes = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index('ix_body_measurements_date_time', 'date', 'time'),
+        Index('ix_body_measurements_updated_at', 'updated_at'),
+    )
+
 class User(Base):
     __tablename__ = "users"
 
@@ -59,7 +169,7 @@ class User(Base):
     read_only = Column(Boolean, default=False)  # Read-only users can view but not modify data
     created_at = Column(Date, default=datetime.date.today)
 
-class UserSettings(Base):
+class UserSettings(SyncColumns, Base):
     __tablename__ = "user_settings"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -70,6 +180,74 @@ class UserSettings(Base):
     # Create a unique constraint on user_id + setting_key
     __table_args__ = (
         UniqueConstraint('user_id', 'setting_key', name='_user_setting_uc'),
+        Index('ix_user_settings_user_updated_at', 'user_id', 'updated_at'),
     )
 
+class MetricRollup(Base):
+    """Per-day / per-ISO-week aggregate of one numeric Log or BodyMeasurement column, kept up to date by rollups.py."""
+    __tablename__ = "metric_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)  # source table, "logs" or "body_measurements"
+    metric = Column(String, nullable=False)  # column name in the source table
+    granularity = Column(String, nullable=False)  # "day" or "week"
+    bucket = Column(Date, nullable=False)  # the day, or the Monday of the ISO week
+    count = Column(Integer, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    mean = Column(Float, nullable=False)
+    last = Column(Float, nullable=False)  # value of the latest row (by date, time, id) in the bucket
+
+    __table_args__ = (
+        UniqueConstraint('source', 'metric', 'granularity', 'bucket', name='_metric_rollup_uc'),
+    )
+
+class MedicationCurve(Base):
+    """Last precomputed default medication level curve, persisted by medication_worker.py (optional)."""
+    __tablename__ = "medication_curves"
+
+    fingerprint = Column(String, primary_key=True)  # medication_calculator.jab_fingerprint of the jab history
+    levels = Column(Text, nullable=False)  # JSON list of {"datetime", "level"}
+
 Base.metadata.create_all(bind=engine)
+
+def add_missing_columns(connection):
+    """
+    Add the columns introduced later to tables that already exist. Rows that predate
+    updated_at get the migration time, so incremental syncs treat them like any other row.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=connection.dialect)}"))
+                if column.name == "updated_at":
+                    connection.execute(update(table).values(updated_at=utcnow()))
+
+# create_all skips tables that already exist, so add columns and indexes introduced later to existing databases
+with engine.begin() as connection:
+    add_missing_columns(connection)
+
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+def upsert_settings_statement(dialect_name: str, user_id: int, settings: dict):
+    """
+    One INSERT ... ON CONFLICT(user_id, setting_key) DO UPDATE for all of settings,
+    relying on the _user_setting_uc constraint. SQLite and Postgres only.
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    now = utcnow()
+    statement = insert(UserSettings).values([
+        {"user_id": user_id, "setting_key": key, "setting_value": value, "updated_at": now, "deleted": False}
+        for key, value in settings.items()
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=[UserSettings.user_id, UserSettings.setting_key],
+        set_={"setting_value": statement.excluded.setting_value, "updated_at": now, "deleted": False},
+    )
@@ -0,0 +1,65 @@
+"""
+Date-range filtering and keyset pagination for the list endpoints.
+
+Rows are ordered by (date, time, id). A page ends with an opaque cursor encoding the
+(date, time, id) of its last row; the next page continues strictly after it, so every
+page is an index range read no matter how deep into the history it is.
+"""
+import base64
+import datetime
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(row) -> str:
+    """Opaque cursor for the position right after row."""
+    payload = json.dumps([row.date.isoformat(), row.time.isoformat(), row.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor, returns (date, time, id)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, time, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.date.fromisoformat(date), datetime.time.fromisoformat(time), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_query(query, model, since: datetime.date | None = None, until: datetime.date | None = None,
+                 cursor: str | None = None, limit: int | None = None):
+    """
+    Filter query to the live (not deleted) rows in [since, until], continue after cursor and
+    order by (date, time, id). Works on ORM Query objects as well as select() statements.
+    """
+    query = query.filter(model.deleted == False)
+    if since is not None:
+        query = query.filter(model.date >= since)
+    if until is not None:
+        query = query.filter(model.date <= until)
+    if cursor is not None:
+        query = query.filter(tuple_(model.date, model.time, model.id) > decode_cursor(cursor))
+    query = query.order_by(model.date.asc(), model.time.asc(), model.id.asc())
+    if limit is not None:
+        # one extra row tells us whether there is a next page
+        query = query.limit(limit + 1)
+    return query
+
+
+def fetch_page(query, limit: int | None = None):
+    """Run a keyset_query, returns (rows, headers) with X-Next-Cursor set if there are more rows."""
+    return page_rows(query.all(), limit)
+
+
+def page_rows(rows, limit: int | None = None):
+    """Trim the extra row fetched by keyset_query, returns (rows, headers) like fetch_page."""
+    headers = {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1])
+    return rows, headers
@@ -0,0 +1,134 @@
+"""
+Bounded bcrypt worker pool.
+
+bcrypt is deliberately slow and CPU bound. Running it in FastAPI's shared threadpool lets a
+burst of logins occupy every worker thread, so it runs on a small dedicated process pool
+(which also escapes the GIL) instead. At most max_pending hashes may be queued or running;
+anything beyond that is rejected right away with PasswordHasherBusy so callers can answer
+with a fast 503 instead of piling up. A pool whose worker died (OOM kill, crash) is broken for
+good, so it is replaced and the hash retried once on the new pool.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def _timed_checkpw(password: bytes, hashed: bytes, submitted_at: float):
+    started_at = time.time()
+    result = bcrypt.checkpw(password, hashed)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _timed_hashpw(password: bytes, submitted_at: float):
+    started_at = time.time()
+    result = bcrypt.hashpw(password, bcrypt.gensalt())
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = 2, max_pending: int = 8):
+        """workers=0 hashes in the calling thread, still subject to the max_pending limit."""
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn, not fork: the server process has threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _submit(self, fn, *args):
+        """Run fn on the pool, replacing a broken pool and retrying once; PasswordHasherBusy if that breaks too."""
+        for attempt in range(2):
+            with self._lock:
+                executor = self._get_executor()
+            try:
+                return executor.submit(fn, *args, time.time()).result()
+            except BrokenProcessPool:
+                logger.warning("bcrypt worker pool is broken (a worker died), starting a new one")
+                self._discard_executor(executor)
+        raise PasswordHasherBusy()
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            # Concurrent callers see the same broken pool, only the first one replaces it
+            if self._executor is executor:
+                self._executor = None
+                self.pool_restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            if self.workers > 0:
+                result, queue_wait, hash_time = self._submit(fn, *args)
+            else:
+                result, queue_wait, hash_time = fn(*args, time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        with self._lock:
+            self.completed += 1
+            self.queue_wait_total += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            self.hash_time_total += hash_time
+            self.hash_time_max = max(self.hash_time_max, hash_time)
+        logger.info(f"bcrypt {fn.__name__.removeprefix('_timed_')}: queue wait {queue_wait * 1000:.1f} ms, hash {hash_time * 1000:.1f} ms")
+        return result
+
+    def checkpw(self, password: bytes, hashed: bytes) -> bool:
+        return self._run(_timed_checkpw, password, hashed)
+
+    def hashpw(self, password: bytes) -> bytes:
+        return self._run(_timed_hashpw, password)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "pool_restarts": self.pool_restarts,
+                "queue_wait_avg_ms": round(self.queue_wait_total / completed * 1000, 2),
+                "queue_wait_max_ms": round(self.queue_wait_max * 1000, 2),
+                "hash_time_avg_ms": round(self.hash_time_total / completed * 1000, 2),
+                "hash_time_max_ms": round(self.hash_time_max * 1000, 2),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
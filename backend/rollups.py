@@ -0,0 +1,185 @@
+"""
+Daily and ISO-week rollups (count, min, max, mean, last) of the numeric Log and
+BodyMeasurement columns, stored in the metric_rollups table.
+
+The write handlers call refresh() with the dates a write touched, before committing, so
+only the day and week buckets containing those dates are recomputed, in the same
+transaction as the write. Each recompute is one GROUP BY date query; week buckets are
+combined from its day totals. rebuild() recomputes everything; run it once on a database
+that has history from before the rollup table existed:
+
+    cd backend && python rollups.py
+"""
+import argparse
+import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Float, Integer, delete, func, insert, select
+from sqlalchemy.orm import aliased
+
+import models
+
+GRANULARITIES = ("day", "week")
+# refresh() recomputes touched weeks this close together in one statement
+REFRESH_MERGE_WEEKS = 4
+
+
+def _numeric_columns(model) -> List[str]:
+    return [
+        column.name for column in model.__table__.columns
+        if column.name != "id" and isinstance(column.type, (Float, Integer))
+    ]
+
+
+ROLLUP_SOURCES = {
+    "logs": (models.Log, _numeric_columns(models.Log)),
+    "body_measurements": (models.BodyMeasurement, _numeric_columns(models.BodyMeasurement)),
+}
+ROLLUP_METRICS = {metric: source for source, (_, metrics) in ROLLUP_SOURCES.items() for metric in metrics}
+
+
+def bucket_start(date: datetime.date, granularity: str) -> datetime.date:
+    """The day itself, or the Monday starting its ISO week."""
+    if granularity == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    return date
+
+
+def _day_totals(model, metrics: List[str], first=None, last=None):
+    """
+    One GROUP BY date over the non-deleted rows dated [first, last] (all if None): per metric
+    count, min, max, sum and the latest non-null value by (time, id), found through the
+    (date, time) index.
+    """
+    columns = [model.date]
+    for metric in metrics:
+        value = getattr(model, metric)
+        latest = aliased(model)
+        latest_value = select(getattr(latest, metric)).where(
+            latest.date == model.date, latest.deleted == False, getattr(latest, metric).isnot(None)
+        ).order_by(latest.time.desc(), latest.id.desc()).limit(1).scalar_subquery()
+        columns += [func.count(value), func.min(value), func.max(value), func.sum(value), latest_value]
+    query = select(*columns).where(model.deleted == False)
+    if first is not None:
+        query = query.where(model.date.between(first, last))
+    return query.group_by(model.date).order_by(model.date.asc())
+
+
+def _entry(source: str, metric: str, granularity: str, bucket: datetime.date, total: List) -> Dict:
+    count, minimum, maximum, value_sum, last = total
+    return {
+        "source": source,
+        "metric": metric,
+        "granularity": granularity,
+        "bucket": bucket,
+        "count": count,
+        "min": minimum,
+        "max": maximum,
+        "mean": value_sum / count,
+        "last": last,
+    }
+
+
+def _rollup_entries(source: str, metrics: List[str], days: Iterable) -> List[Dict]:
+    """Day and week rollup rows from _day_totals rows, weeks combine their (date ordered) days."""
+    entries = []
+    weeks: Dict[datetime.date, List] = {}
+    for date, *totals in days:
+        week = weeks.setdefault(bucket_start(date, "week"), [None] * len(metrics))
+        for index, metric in enumerate(metrics):
+            total = totals[index * 5:index * 5 + 5]
+            if not total[0]:
+                continue
+            entries.append(_entry(source, metric, "day", date, total))
+            combined = week[index]
+            if combined is None:
+                week[index] = list(total)
+            else:
+                combined[0] += total[0]
+                combined[1] = min(combined[1], total[1])
+                combined[2] = max(combined[2], total[2])
+                combined[3] += total[3]
+                combined[4] = total[4]
+    for week, totals in weeks.items():
+        entries.extend(
+            _entry(source, metric, "week", week, total) for metric, total in zip(metrics, totals) if total is not None
+        )
+    return entries
+
+
+def _recompute(db, source: str, first: datetime.date | None = None, last: datetime.date | None = None) -> int:
+    """Insert the day and week rollups of source for the rows dated [first, last], all if None."""
+    model, metrics = ROLLUP_SOURCES[source]
+    entries = _rollup_entries(source, metrics, db.execute(_day_totals(model, metrics, first, last)))
+    if entries:
+        db.execute(insert(models.MetricRollup.__table__), entries)
+    return len(entries)
+
+
+def _week_ranges(dates: Iterable[datetime.date]) -> List[Tuple[datetime.date, datetime.date]]:
+    """
+    (Monday, Sunday) ranges covering the weeks of dates. Touched weeks less than
+    REFRESH_MERGE_WEEKS apart share a range, the weeks in between are recomputed unchanged.
+    """
+    weeks = sorted({bucket_start(date, "week") for date in dates})
+    ranges = []
+    for week in weeks:
+        if ranges and (week - ranges[-1][1]).days <= REFRESH_MERGE_WEEKS * 7:
+            ranges[-1][1] = week
+        else:
+            ranges.append([week, week])
+    return [(first, last + datetime.timedelta(days=6)) for first, last in ranges]
+
+
+def refresh(db, source: str, dates: Iterable[datetime.date | None]):
+    """Recompute the day and week buckets of source containing dates. Does not commit."""
+    dates = {date for date in dates if date is not None}
+    if source not in ROLLUP_SOURCES or not dates:
+        return
+    db.flush()
+    # One GROUP BY per range of touched weeks; a whole week also covers all of its day buckets
+    for first, last in _week_ranges(dates):
+        db.execute(delete(models.MetricRollup).where(
+            models.MetricRollup.source == source,
+            models.MetricRollup.bucket.between(first, last),
+        ))
+        _recompute(db, source, first, last)
+
+
+def rebuild(db) -> int:
+    """Recompute all rollups from the raw rows. Does not commit, returns the number of rollup rows."""
+    db.execute(delete(models.MetricRollup))
+    return sum(_recompute(db, source) for source in ROLLUP_SOURCES)
+
+
+def read_rollups(db, metric: str, granularity: str,
+                 since: datetime.date | None = None, until: datetime.date | None = None):
+    """Rollup rows of metric ordered by bucket, for buckets starting in [since, until]."""
+    query = select(
+        models.MetricRollup.bucket, models.MetricRollup.count, models.MetricRollup.min,
+        models.MetricRollup.max, models.MetricRollup.mean, models.MetricRollup.last,
+    ).where(
+        models.MetricRollup.source == ROLLUP_METRICS[metric],
+        models.MetricRollup.metric == metric,
+        models.MetricRollup.granularity == granularity,
+    )
+    if since is not None:
+        query = query.where(models.MetricRollup.bucket >= bucket_start(since, granularity))
+    if until is not None:
+        query = query.where(models.MetricRollup.bucket <= until)
+    return db.execute(query.order_by(models.MetricRollup.bucket.asc())).all()
+
+
+def main():
+    argparse.ArgumentParser(description="Rebuild the metric_rollups table from the raw history.").parse_args()
+    db = models.SessionLocal()
+    try:
+        total = rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt {total} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
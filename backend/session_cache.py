@@ -0,0 +1,169 @@
+"""
+Cache of verified auth tokens.
+
+Maps an auth cookie token to a snapshot of the user it belongs to, so steady-state
+authentication is one dict lookup instead of an HMAC check plus a user SELECT.
+Entries expire after a TTL (and never outlive the token itself), the cache is bounded
+with LRU eviction, and invalidate_user() drops every token of a user whose account changed.
+
+Two things keep entries in line with the users table. watch_user_changes() invalidates
+right away for rows changed through this process's ORM sessions. recheck() compares the
+entries with the current rows (a SELECT of the small users table) at most every
+recheck_seconds, which catches changes made by other processes (admin scripts, other
+workers, plain SQL). A changed, deactivated or deleted user's session therefore outlives
+the change by at most recheck_seconds, not by the TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+
+@dataclass(frozen=True)
+class SessionUser:
+    """The user fields the auth dependencies hand to the endpoints."""
+    id: int
+    username: str
+    read_only: bool
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "SessionUser":
+        return cls(id=user.id, username=user.username, read_only=bool(user.read_only), is_active=bool(user.is_active))
+
+
+class SessionCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, recheck_seconds: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.recheck_seconds = recheck_seconds
+        self._rechecked_at = float("-inf")
+        self._recheck_lock = threading.Lock()
+        self._entries = OrderedDict()  # token -> (expires_at, SessionUser)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rechecks = 0
+
+    def get(self, token: str) -> SessionUser | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= now:
+                del self._entries[token]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: SessionUser, token_valid_for: float | None = None):
+        """Cache user for token; token_valid_for caps the entry at the token's remaining lifetime."""
+        ttl = self.ttl_seconds if token_valid_for is None else min(self.ttl_seconds, token_valid_for)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, username: str):
+        """Forget every cached token of username, e.g. after the account was changed or deactivated."""
+        with self._lock:
+            stale = [token for token, (_, user) in self._entries.items() if user.username == username]
+            for token in stale:
+                del self._entries[token]
+            self.invalidations += len(stale)
+
+    def recheck(self, load_users: Callable[[], Iterable[SessionUser]]):
+        """
+        Drop the entries whose user no longer matches its row, if recheck_seconds have passed
+        since the last recheck. load_users returns every user as a SessionUser; while one
+        thread rechecks, the others go on without waiting.
+        """
+        if time.monotonic() - self._rechecked_at < self.recheck_seconds or not self._recheck_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._rechecked_at < self.recheck_seconds:
+                return
+            current = {user.username: user for user in load_users()}
+            with self._lock:
+                stale = [token for token, (_, user) in self._entries.items() if current.get(user.username) != user]
+                for token in stale:
+                    del self._entries[token]
+                self.invalidations += len(stale)
+                self.rechecks += 1
+            self._rechecked_at = time.monotonic()
+        finally:
+            self._recheck_lock.release()
+
+    def watch_user_changes(self, user_model):
+        """
+        Invalidate the tokens of every user_model row updated or deleted through an ORM session,
+        once the transaction commits. Bulk UPDATE/DELETE statements on the table clear the cache.
+        """
+        def row_changed(mapper, connection, target):
+            # The old name too, in case the username itself was changed
+            usernames = {target.username, *inspect(target).attrs.username.history.deleted}
+            changed = object_session(target).info.setdefault("changed_usernames", set())
+            if changed is not None:
+                changed.update(usernames)
+
+        def statement_executed(orm_execute_state):
+            mapper = orm_execute_state.bind_mapper
+            if (orm_execute_state.is_update or orm_execute_state.is_delete) and mapper is not None and mapper.class_ is user_model:
+                orm_execute_state.session.info["changed_usernames"] = None
+
+        def committed(session):
+            if "changed_usernames" not in session.info:
+                return
+            changed = session.info.pop("changed_usernames")
+            if changed is None:
+                self.clear()
+            for username in changed or ():
+                self.invalidate_user(username)
+
+        def rolled_back(session):
+            session.info.pop("changed_usernames", None)
+
+        event.listen(user_model, "after_update", row_changed)
+        event.listen(user_model, "after_delete", row_changed)
+        event.listen(Session, "do_orm_execute", statement_executed)
+        event.listen(Session, "after_commit", committed)
+        event.listen(Session, "after_rollback", rolled_back)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "recheck_seconds": self.recheck_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rechecks": self.rechecks,
+            }
@@ -0,0 +1,51 @@
+"""
+In-process cache of each user's settings.
+
+Every user has a version number that is bumped on each settings write. Readers remember
+the version they started with and only store what they read if no write happened in
+between, so a slow read can never put stale settings back into the cache.
+"""
+import threading
+from typing import Dict, Tuple
+
+
+class SettingsCache:
+    def __init__(self):
+        self._versions: Dict[int, int] = {}
+        self._entries: Dict[int, Tuple[int, Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: int) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def get(self, user_id: int) -> Tuple[int, Dict[str, str] | None]:
+        """Returns (current version, cached settings or None)."""
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return version, entry[1]
+            self.misses += 1
+            return version, None
+
+    def put(self, user_id: int, version: int, settings: Dict[str, str]):
+        """Store settings read at version, unless a write has bumped the version since."""
+        with self._lock:
+            if self._versions.get(user_id, 0) == version:
+                self._entries[user_id] = (version, settings)
+
+    def bump(self, user_id: int) -> int:
+        """Record a settings write for user_id and drop the cached copy."""
+        with self._lock:
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+            self._entries.pop(user_id, None)
+            return version
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,107 @@
+"""
+Delta sync for offline-capable clients.
+
+Every write stamps the row's updated_at, and deletes leave a tombstone (deleted = true)
+instead of removing the row. A sync token is an opaque encoding of a point in time;
+/api/sync?since=<token> returns the rows changed or deleted after it, found through the
+updated_at indexes, plus a new token for the next call. Without a token it returns every
+live row, for a client starting from scratch.
+
+The new token lies SYNC_OVERLAP before the time the sync started, so a write that stamped
+its rows just before the sync but committed just after is still picked up next time. Rows
+in that window can be sent twice; clients upsert by id, so that is harmless.
+
+Tombstones are kept for a retention period and then purged. A token older than the
+retention may predate a purged tombstone, so it gets a full sync ("full": true) instead,
+and the client replaces its copy.
+"""
+import base64
+import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+
+import models
+from export import EXPORT_TABLES
+from pagination import keyset_query
+
+SYNC_TABLES = EXPORT_TABLES
+
+
+def encode_token(moment: datetime.datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> datetime.datetime:
+    """Inverse of encode_token."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return datetime.datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+def sync_columns(model):
+    """The columns of synced rows: the regular payload plus updated_at (deleted rows go into "deleted")."""
+    return [column for column in model.__table__.columns if column.name != "deleted"]
+
+
+def table_changes(db, model, since: datetime.datetime | None) -> dict:
+    """{"changed": [rows], "deleted": [ids]} of model since (all live rows if since is None)."""
+    columns = sync_columns(model)
+    if since is None:
+        rows = db.execute(keyset_query(select(*columns), model)).all()
+        return {"changed": [row._asdict() for row in rows], "deleted": []}
+
+    rows = db.execute(
+        select(*columns, model.deleted).where(model.updated_at > since).order_by(model.updated_at.asc(), model.id.asc())
+    ).all()
+    return {
+        "changed": [dict(zip(row._fields[:-1], row[:-1])) for row in rows if not row.deleted],
+        "deleted": [row.id for row in rows if row.deleted],
+    }
+
+
+def settings_changes(db, user_id: int, since: datetime.datetime | None) -> dict:
+    """{"changed": {key: value}, "deleted": [keys]} of user_id's settings since."""
+    query = select(
+        models.UserSettings.setting_key, models.UserSettings.setting_value, models.UserSettings.deleted
+    ).where(models.UserSettings.user_id == user_id)
+    if since is None:
+        query = query.where(models.UserSettings.deleted == False)
+    else:
+        query = query.where(models.UserSettings.updated_at > since)
+    rows = db.execute(query).all()
+    return {
+        "changed": {row.setting_key: row.setting_value for row in rows if not row.deleted},
+        "deleted": [row.setting_key for row in rows if row.deleted],
+    }
+
+
+def sync_changes(db, user_id: int, token: str | None, overlap: datetime.timedelta, retention: datetime.timedelta) -> dict:
+    """
+    The /api/sync response: changes of every table and user_id's settings since token, and the
+    next token. Tokens older than retention (the tombstone retention) get a full sync.
+    """
+    since = decode_token(token) if token is not None else None
+    now = models.utcnow()
+    if since is not None and since < now - retention:
+        since = None
+    next_token = now - overlap
+    if since is not None:
+        next_token = max(next_token, since)
+
+    result = {"token": encode_token(next_token), "full": since is None}
+    for table, model in SYNC_TABLES.items():
+        result[table] = table_changes(db, model, since)
+    result["settings"] = settings_changes(db, user_id, since)
+    return result
+
+
+def purge_tombstones(db, older_than: datetime.datetime) -> int:
+    """Delete the tombstones last changed before older_than from every synced table; returns how many."""
+    purged = 0
+    for model in (*SYNC_TABLES.values(), models.UserSettings):
+        purged += db.execute(delete(model).where(model.deleted == True, model.updated_at < older_than)).rowcount
+    db.commit()
+    return purged
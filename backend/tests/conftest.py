@@ -0,0 +1,56 @@
+"""
+Test setup: a throwaway SQLite database and a logged-in client.
+
+Run from backend/ with `python -m pytest tests`. Set DATABASE_ASYNC=true to run the same
+tests against the async handlers.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("ENVIRONMENT", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from fastapi.testclient import TestClient
+
+    import main
+    with TestClient(main.app) as client:
+        response = client.post("/api/auth/register", json={"username": main.ADMIN_USER, "password": "password", "read_only": False})
+        assert response.status_code == 200, response.text
+        yield main.app
+
+
+@pytest.fixture
+def client(app):
+    """Client logged in as the admin user."""
+    from fastapi.testclient import TestClient
+
+    import main
+    # Not entered as a context manager: the app's lifespan (worker shutdown) belongs to the session
+    client = TestClient(app)
+    response = client.post("/api/auth/login", json={"username": main.ADMIN_USER, "password": "password"})
+    assert response.status_code == 200, response.text
+    token = response.cookies["auth_token"]
+    client.cookies.clear()
+    client.cookies.set("auth_token", token)
+    return client
+
+
+@pytest.fixture
+def precomputed():
+    """Waits until the background medication curve is up to date with the jabs table."""
+    import main
+
+    def wait(timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while main.medication_precomputer.current(main.table_versions.get("jabs")) is None:
+            assert time.monotonic() < deadline, "medication curve was not precomputed in time"
+            time.sleep(0.05)
+    return wait
@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import models
+
+pytestmark = pytest.mark.skipif(not models.DATABASE_ASYNC, reason="needs DATABASE_ASYNC=true")
+
+TABLES = {"/api/logs": {"weight": 80.5}, "/api/jabs": {"dose": 2.5}, "/api/body-measurements": {"waist": 90.0}}
+
+
+class EndpointRecorder:
+    """ASGI wrapper that remembers which endpoint the router dispatched each request to."""
+
+    def __init__(self, app):
+        self.app = app
+        self.endpoints = []
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                self.endpoints.append(scope.get("endpoint"))
+
+
+@pytest.fixture
+def recorded(client):
+    recorder = EndpointRecorder(main.app)
+    return TestClient(recorder, cookies=dict(client.cookies)), recorder
+
+
+@pytest.mark.parametrize("path", TABLES)
+def test_writes_use_async_handlers(recorded, path):
+    client, recorder = recorded
+    row_id = client.post(path, json=TABLES[path]).json()["id"]
+    assert client.put(f"{path}/{row_id}", json=TABLES[path]).status_code == 200
+    assert client.delete(f"{path}/{row_id}").status_code == 200
+    assert client.delete(f"{path}/{row_id}").status_code == 404
+    assert [endpoint.__module__ for endpoint in recorder.endpoints] == ["async_routes"] * 4
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+import fast_json
+import models
+
+
+@pytest.fixture
+def orjson_only(monkeypatch):
+    """Fail any response that falls back to the json module."""
+    class NoFallback:
+        @staticmethod
+        def dumps(*args, **kwargs):
+            raise AssertionError("FastJSONResponse fell back to json.dumps")
+
+    monkeypatch.setattr(fast_json, "json", NoFallback)
+
+
+def starlette_bytes(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def test_medication_levels_encode_with_orjson(client, orjson_only, precomputed):
+    client.post("/api/jabs", json={"date": "2025-01-01", "time": "10:00:00", "dose": 2.5})
+    client.post("/api/jabs", json={"date": "2025-01-08", "time": "10:00:00", "dose": 5.0})
+    for query in ("", "?resolution=2", "?max_points=50", "?stale_ok=true"):
+        if query == "?stale_ok=true":
+            precomputed()
+        response = client.get(f"/api/medication-levels{query}")
+        assert response.status_code == 200, (query, response.text)
+        assert response.json() and response.content == starlette_bytes(response.json())
+
+
+@pytest.mark.parametrize("path, model, body", [
+    ("/api/logs", models.Log, {}), ("/api/jabs", models.Jab, {"dose": 2.5}), ("/api/body-measurements", models.BodyMeasurement, {}),
+])
+def test_rows_keyed_in_column_order(client, orjson_only, path, model, body):
+    created = client.post(path, json=body).json()
+    rows = client.get(path).json()
+    # The sync bookkeeping columns are left to /api/sync
+    names = [column.name for column in model.__table__.columns if column.name not in ("updated_at", "deleted")]
+    assert rows and all(list(row) == names for row in rows)
+    assert list(created) == names and list(client.get(f"{path}/last").json()) == names
+    synced = client.get("/api/sync").json()[model.__tablename__]["changed"]
+    assert synced and all(list(row) == names + ["updated_at"] for row in synced)
+
+
+def test_falls_back_for_floats_json_writes_differently():
+    assert fast_json.FastJSONResponse({"level": 0.00001, "big": 1e16}).body == starlette_bytes({"level": 0.00001, "big": 1e16})
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from scipy.linalg import expm
+
+import medication_calculator as mc
+
+P = mc.DEFAULT_PK_PARAMETERS
+MODEL = (P.CL_apparent, P.Vc, P.Q, P.Vp)
+DOSES = [(2.5, 168.0 * week + 3.25) for week in range(6)] + [(5.0, 1010.0)]
+
+
+def disposition_rates():
+    """The two rates of the central/peripheral system, -eigenvalues of K without absorption."""
+    lam = np.linalg.eigvals(mc._system_matrix(1.0, *MODEL))
+    return sorted(-lam[lam > -0.9].real)
+
+
+def exact_central(ka, t):
+    """Central amount by summing expm(K (t - td)) over the doses, one point at a time."""
+    K = mc._system_matrix(ka, *MODEL)
+    return np.array([sum(P.F * D * expm(K * (ti - td))[1, 0] for D, td in DOSES if td <= ti) for ti in t])
+
+
+@pytest.mark.parametrize("ka", disposition_rates() + [P.ka])
+@pytest.mark.parametrize("engine", ["superposition", "matrix", "expm", "odeint"])
+def test_engines_match_expm_when_ka_equals_an_eigenvalue(ka, engine):
+    t, _, A_c, _, _ = mc.simulate(DOSES, P.F, ka, *MODEL, engine=engine)
+    assert np.abs(A_c - exact_central(ka, t)).max() < 1e-9
+
+
+@pytest.mark.parametrize("ka", disposition_rates())
+def test_batch_matches_expm_when_ka_equals_an_eigenvalue(ka):
+    t = np.arange(0.0, 1400.0, 0.7)
+    params = {name: np.full(2, getattr(P, name)) for name in ("CL_apparent", "Vc", "Q", "Vp", "F")}
+    params["ka"] = np.array([ka, P.ka])
+    A_c = mc.simulate_central_batch(DOSES, t, params)
+    assert not mc.modal_form_usable(ka, *MODEL)
+    assert np.abs(A_c[:, 0] - exact_central(ka, t)).max() < 1e-9
+    assert np.abs(A_c[:, 1] - exact_central(P.ka, t)).max() < 1e-9
+
+
+def test_state_cache_adds_later_doses_incrementally():
+    cache = mc.StateSeriesCache()
+    for count in (3, 5, len(DOSES)):
+        t, A = cache.states(DOSES[:count], P)
+        t_full, A_full = mc._superposition_states(DOSES[:count], P.F, P.ka, *MODEL, 0.5, 14)
+        assert np.array_equal(t, t_full)
+        assert np.abs(A - A_full).max() < 1e-12
+    assert cache.stats()["extensions"] == 2
+
+    # A back-dated dose is simulated from scratch
+    t, A = cache.states(DOSES + [(2.5, 500.0)], P)
+    assert cache.stats()["simulations"] == 2
+    assert cache.states(DOSES + [(2.5, 500.0)], P)[1] is A
+
+
+def test_engines_sample_the_same_instants():
+    reference = mc.simulate(DOSES, P.F, P.ka, *MODEL, engine="odeint")
+    assert reference[2][0] == 0.0
+    for engine in ("superposition", "matrix", "expm"):
+        result = mc.simulate(DOSES, P.F, P.ka, *MODEL, engine=engine)
+        assert np.array_equal(result[0], reference[0])
+        assert np.abs(result[2] - reference[2]).max() < 1e-9
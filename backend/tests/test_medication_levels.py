@@ -0,0 +1,56 @@
+import datetime
+import threading
+import time
+
+import main
+import medication_calculator
+
+
+def test_levels_do_not_wait_for_the_precompute(client, monkeypatch, precomputed):
+    release = threading.Event()
+    compute = main.medication_precomputer._compute
+    monkeypatch.setattr(main.medication_precomputer, "_compute", lambda jabs: release.wait(30) and compute(jabs))
+    try:
+        client.post("/api/jabs", json={"date": "2025-02-01", "time": "09:00:00", "dose": 2.5})
+        started = time.perf_counter()
+        response = client.get("/api/medication-levels")
+        assert time.perf_counter() - started < 5
+        assert response.status_code == 200 and response.json()
+        assert main.MEDICATION_VERSION_HEADER not in response.headers
+
+        expected = response.json()
+        release.set()
+        precomputed()
+        response = client.get("/api/medication-levels")
+        assert main.MEDICATION_VERSION_HEADER in response.headers
+        assert response.json() == expected
+    finally:
+        release.set()
+
+
+def test_window_offsets_are_converted(client):
+    client.post("/api/jabs", json={"date": "2025-03-01", "time": "08:00:00", "dose": 2.5})
+    first = {}
+    for offset in ("Z", "+05:00"):
+        response = client.get("/api/medication-levels", params={"start": f"2025-03-03T12:00:00{offset}", "end": f"2025-03-04T12:00:00{offset}"})
+        assert response.status_code == 200, response.text
+        first[offset] = datetime.datetime.fromisoformat(response.json()[0]["datetime"])
+    # The same wall-clock time five hours east is five hours earlier
+    assert first["Z"] - first["+05:00"] == datetime.timedelta(hours=5)
+    expected = datetime.datetime(2025, 3, 3, 12, tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    assert datetime.timedelta(0) <= first["Z"] - expected < datetime.timedelta(hours=1)
+
+
+def test_bands_are_capped_and_cached_apart(client, monkeypatch):
+    monkeypatch.setattr(medication_calculator, "BAND_MAX_CELLS", 20000)
+    client.post("/api/jabs", json={"date": "2025-04-01", "time": "08:00:00", "dose": 2.5})
+    levels = client.get("/api/medication-levels", params={"max_points": 50}).json()
+    response = client.get("/api/medication-levels/bands", params={"samples": 100})
+    assert response.status_code == 200, response.text
+    bands = response.json()
+    assert 4 <= len(bands) <= 200 and {"level", "p5", "p50", "p95"} <= bands[0].keys()
+
+    stats = client.get("/api/medication-levels/cache-stats").json()
+    assert stats["bands"]["entries"] == 1 and stats["entries"] >= 1
+    assert client.get("/api/medication-levels", params={"max_points": 50}).json() == levels
+    assert client.get("/api/medication-levels/cache-stats").json()["hits"] == stats["hits"] + 1
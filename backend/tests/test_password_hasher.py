@@ -0,0 +1,29 @@
+import bcrypt
+
+import main
+from password_hasher import PasswordHasher
+
+
+def kill_workers(hasher: PasswordHasher):
+    for process in list(hasher._executor._processes.values()):
+        process.kill()
+        process.join()
+
+
+def test_hash_survives_a_killed_worker():
+    hasher = PasswordHasher(workers=1)
+    try:
+        hashed = hasher.hashpw(b"password")
+        kill_workers(hasher)
+        assert hasher.checkpw(b"password", hashed)
+        assert bcrypt.checkpw(b"other", hasher.hashpw(b"other"))
+        assert hasher.stats()["pool_restarts"] == 1
+    finally:
+        hasher.shutdown()
+
+
+def test_login_survives_a_killed_worker(client):
+    client.post("/api/auth/login", json={"username": main.ADMIN_USER, "password": "password"})
+    kill_workers(main.password_hasher)
+    response = client.post("/api/auth/login", json={"username": main.ADMIN_USER, "password": "password"})
+    assert response.status_code == 200, response.text
@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import models
+
+
+def logged_in(app, username: str) -> TestClient:
+    client = TestClient(app)
+    token = client.post("/api/auth/login", json={"username": username, "password": "password"}).cookies["auth_token"]
+    client.cookies.clear()
+    client.cookies.set("auth_token", token)
+    return client
+
+
+def status(client: TestClient) -> int:
+    return client.get("/api/auth/session-cache-stats").status_code
+
+
+def set_active(username: str, active: bool):
+    db = models.SessionLocal()
+    db.query(models.User).filter(models.User.username == username).one().is_active = active
+    db.commit()
+    db.close()
+
+
+def test_user_changes_drop_cached_sessions(app, client):
+    response = client.post("/api/auth/register", json={"username": "carol", "password": "password", "read_only": True})
+    assert response.status_code == 200, response.text
+    carol = logged_in(app, "carol")
+    assert status(carol) == 200 and status(carol) == 200
+
+    # Row update
+    set_active("carol", False)
+    assert status(carol) == 401
+
+    # Bulk update
+    set_active("carol", True)
+    assert status(carol) == 200
+    db = models.SessionLocal()
+    db.query(models.User).filter(models.User.username == "carol").update({"is_active": False})
+    db.commit()
+    db.close()
+    assert status(carol) == 401
+
+    # Row delete
+    set_active("carol", True)
+    assert status(carol) == 200
+    db = models.SessionLocal()
+    db.delete(db.query(models.User).filter(models.User.username == "carol").one())
+    db.commit()
+    db.close()
+    assert status(carol) == 401
+
+
+def test_changes_from_outside_the_process_are_picked_up(app, client, monkeypatch):
+    import main
+
+    response = client.post("/api/auth/register", json={"username": "dave", "password": "password", "read_only": True})
+    assert response.status_code == 200, response.text
+    dave = logged_in(app, "dave")
+    monkeypatch.setattr(main.session_cache, "recheck_seconds", 3600.0)
+    assert status(dave) == 200 and status(dave) == 200
+
+    # Plain SQL on its own connection, no ORM session: what an admin script in another process does
+    with models.engine.begin() as connection:
+        connection.execute(text("UPDATE users SET is_active = :active WHERE username = 'dave'"), {"active": False})
+    assert status(dave) == 200  # still cached, no recheck due yet
+
+    monkeypatch.setattr(main.session_cache, "recheck_seconds", 0.0)
+    assert status(dave) == 401
@@ -0,0 +1,47 @@
+import datetime
+
+from sqlalchemy import create_engine, select, text, update
+
+import main
+import models
+import sync
+
+
+def test_old_tombstones_are_purged_and_old_tokens_resync_fully(client):
+    jab_id = client.post("/api/jabs", json={"date": "2025-05-01", "time": "08:00:00", "dose": 2.5}).json()["id"]
+    token = client.get("/api/sync").json()["token"]
+    assert client.delete(f"/api/jabs/{jab_id}").status_code == 200
+    assert client.get("/api/sync", params={"since": token}).json()["jabs"]["deleted"] == [jab_id]
+
+    # Age the tombstone past the retention and purge
+    now = models.utcnow()
+    db = models.SessionLocal()
+    db.execute(update(models.Jab).where(models.Jab.id == jab_id).values(updated_at=now - main.SYNC_TOMBSTONE_RETENTION - datetime.timedelta(days=1)))
+    db.commit()
+    assert sync.purge_tombstones(db, now - main.SYNC_TOMBSTONE_RETENTION) >= 1
+    assert db.get(models.Jab, jab_id) is None
+    db.close()
+
+    # A token from before the retention can't be served incrementally any more
+    old_token = sync.encode_token(now - main.SYNC_TOMBSTONE_RETENTION - datetime.timedelta(days=2))
+    assert client.get("/api/sync", params={"since": old_token}).json()["full"] is True
+    assert client.get("/api/sync", params={"since": token}).json()["full"] is False
+
+
+def test_migration_backfills_updated_at(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as connection:
+        # logs as it was before the sync columns
+        connection.execute(text(
+            "CREATE TABLE logs (id INTEGER PRIMARY KEY, date DATE, time TIME, weight FLOAT, body_fat FLOAT,"
+            " muscle FLOAT, visceral_fat INTEGER, sleep FLOAT, notes VARCHAR)"
+        ))
+        connection.execute(text("INSERT INTO logs (date, time, weight) VALUES ('2024-01-01', '08:00:00.000000', 80.0)"))
+    models.Base.metadata.create_all(bind=engine)
+    before = models.utcnow()
+    with engine.begin() as connection:
+        models.add_missing_columns(connection)
+    with engine.connect() as connection:
+        row = connection.execute(select(models.Log.updated_at, models.Log.deleted)).one()
+    assert row.updated_at >= before and row.deleted is False
+    engine.dispose()
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+import pytest
+
+import trend
+
+
+def chart_utils_lowess(values, bandwidth=0.43):
+    """The smoothing loop of calculateMovingAverage in frontend/chartUtils.js, point by point."""
+    n = len(values)
+    span = max(3, int(np.floor(bandwidth * n)))
+    smoothed = []
+    for i in range(n):
+        distances = [abs(j - i) for j in range(n)]
+        max_dist = sorted(distances)[min(span, n - 1)]
+        if max_dist == 0:
+            smoothed.append(values[i])
+            continue
+        weights = [(1 - (d / max_dist) ** 3) ** 3 if d < max_dist else 0.0 for d in distances]
+        sum_w = sum(weights)
+        sum_wx = sum(w * j for j, w in enumerate(weights))
+        sum_wy = sum(w * y for w, y in zip(weights, values))
+        sum_wx2 = sum(w * j * j for j, w in enumerate(weights))
+        sum_wxy = sum(w * j * y for j, (w, y) in enumerate(zip(weights, values)))
+        denom = sum_w * sum_wx2 - sum_wx * sum_wx
+        if abs(denom) > 1e-10:
+            a = (sum_wx2 * sum_wy - sum_wx * sum_wxy) / denom
+            b = (sum_w * sum_wxy - sum_wx * sum_wy) / denom
+            smoothed.append(a + b * i)
+        else:
+            smoothed.append(sum_wy / sum_w)
+    return np.array(smoothed)
+
+
+def noisy_walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return list(80 + np.cumsum(rng.normal(0, 0.3, n)) + rng.normal(0, 1, n))
+
+
+@pytest.mark.parametrize("n", [5, 40, 200])
+def test_short_histories_match_chart_utils(n):
+    values = noisy_walk(n)
+    result = trend.lowess_trend(values, projection_days=0)
+    assert np.allclose(result, chart_utils_lowess(values), atol=1e-9)
+
+
+def test_long_histories_stay_close_to_the_exact_fit(monkeypatch):
+    values = noisy_walk(2000)
+    fast = np.array(trend.lowess_trend(values, projection_days=0))
+    monkeypatch.setattr(trend, "ANCHORS_PER_SPAN", 10 ** 9)
+    exact = np.array(trend.lowess_trend(values, projection_days=0))
+    assert np.abs(fast - exact).max() < 1e-2
+
+
+def test_cost_is_linear_in_history_length():
+    # About 0.3 s; an O(n * span) fit of 30k points takes around 20 s
+    values = noisy_walk(30000)
+    started = time.perf_counter()
+    result = trend.lowess_trend(values)
+    assert time.perf_counter() - started < 5
+    assert len(result) == 30003 and None not in result
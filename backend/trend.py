@@ -0,0 +1,172 @@
+"""
+LOWESS trend lines for the stats charts.
+
+lowess_trend() computes the same thing as calculateMovingAverage in frontend/chartUtils.js:
+a tricube-weighted local linear fit at every valid point (x is the point's position among
+the valid points), linear interpolation over missing values and a short linear projection
+from the last smoothed points. Instead of sorting a distance array per point, the window
+half-width is derived in closed form and the weighted sums are taken over sliding windows.
+
+A fit costs O(span) and span grows with the history, so fitting every point would be
+quadratic. Like the delta parameter of classic LOWESS, the fit is evaluated exactly at anchor
+points spaced span / ANCHORS_PER_SPAN apart (every point for short histories) and linearly
+interpolated in between, which keeps the total cost linear in the number of points.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Rows of the (points x window) weight matrix processed at once, bounds memory for long histories
+CHUNK_ROWS = 512
+# Exact fits per window span; anchors closer than one point apart mean every point is fitted
+ANCHORS_PER_SPAN = 100
+
+
+def _window_half_widths(n: int, span: int) -> np.ndarray:
+    """
+    For every point i, the (span)-th smallest of |j - i| over j in [0, n), i.e. the maxDist
+    chartUtils.js finds by sorting. Within the symmetric part of the window the k-th smallest
+    distance is ceil(k / 2); once one side runs out it grows one per point taken from the other.
+    """
+    k = min(span, n - 1)
+    i = np.arange(n)
+    near_side = np.minimum(i, n - 1 - i)
+    symmetric = (k + 1) // 2
+    return np.where(symmetric <= near_side, symmetric, k - near_side)
+
+
+def _anchor_points(n: int, span: int) -> np.ndarray:
+    """
+    Indices the fit is evaluated at: every span // ANCHORS_PER_SPAN-th point, the last one, and
+    the two points where the window half-width stops growing (the fit has a kink there).
+    """
+    step = max(1, span // ANCHORS_PER_SPAN)
+    symmetric = (min(span, n - 1) + 1) // 2
+    kinks = [index for index in (symmetric, n - 1 - symmetric) if 0 <= index < n]
+    return np.unique(np.concatenate((np.arange(0, n, step), [n - 1], kinks)))
+
+
+def _local_linear_fit(y: np.ndarray, bandwidth: float) -> np.ndarray:
+    n = len(y)
+    span = max(3, int(np.floor(bandwidth * n)))
+    max_dist = _window_half_widths(n, span)
+    reach = int(max_dist.max())
+    if reach == 0:
+        return y.copy()
+    anchors = _anchor_points(n, span)
+
+    # Padded copies so every point sees a full window of offsets -reach + 1 .. reach - 1
+    offsets = np.arange(-reach + 1, reach, dtype=np.float64)
+    pad = reach - 1
+    y_windows = sliding_window_view(np.pad(y, pad), len(offsets))
+    valid_windows = sliding_window_view(np.pad(np.ones(n), pad), len(offsets))
+
+    fitted_at_anchors = np.empty(len(anchors))
+    for start in range(0, len(anchors), CHUNK_ROWS):
+        rows = anchors[start:start + CHUNK_ROWS]
+        scale = max_dist[rows, None].astype(np.float64)
+        u = np.minimum(np.abs(offsets) / scale, 1.0)
+        w = 1 - u * u * u
+        w = w * w * w
+        w *= valid_windows[rows]
+        wy = w * y_windows[rows]
+
+        # x is centred on the point itself, so the fitted value is the intercept
+        sum_w = w.sum(axis=1)
+        sum_wx = w @ offsets
+        sum_wx2 = w @ (offsets * offsets)
+        sum_wy = wy.sum(axis=1)
+        sum_wxy = wy @ offsets
+
+        denom = sum_w * sum_wx2 - sum_wx * sum_wx
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fitted = np.where(
+                np.abs(denom) > 1e-10,
+                (sum_wx2 * sum_wy - sum_wx * sum_wxy) / denom,
+                sum_wy / sum_w,
+            )
+        fitted_at_anchors[start:start + CHUNK_ROWS] = fitted
+    if len(anchors) == n:
+        return fitted_at_anchors
+    return np.interp(np.arange(n), anchors, fitted_at_anchors)
+
+
+def lowess_trend(
+    values: Sequence[Optional[float]],
+    bandwidth: float = 0.43,
+    projection_days: int = 3,
+    min_data_points: int = 3,
+) -> List[Optional[float]]:
+    """
+    Trend line for values (None for missing), len(values) + projection_days long, with the
+    same defaults and output as calculateMovingAverage in chartUtils.js.
+    """
+    data = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    valid_indices = np.flatnonzero(~np.isnan(data))
+    if len(valid_indices) < min_data_points:
+        return [None] * (len(data) + projection_days)
+
+    smoothed = _local_linear_fit(data[valid_indices], bandwidth)
+
+    # Map back to the original positions and interpolate interior gaps; leading and
+    # trailing gaps stay empty
+    result = np.full(len(data), np.nan)
+    first, last = valid_indices[0], valid_indices[-1]
+    result[first:last + 1] = np.interp(np.arange(first, last + 1), valid_indices, smoothed)
+
+    trend = [None if np.isnan(value) else float(value) for value in result]
+
+    if projection_days > 0 and len(smoothed) >= 2:
+        # Slope of a least-squares line through the last few smoothed points
+        recent = smoothed[-min(10, len(smoothed)):]
+        slope = np.polyfit(np.arange(len(recent)), recent, 1)[0]
+        trend.extend(float(smoothed[-1] + slope * day) for day in range(1, projection_days + 1))
+    return trend
+
+
+class TrendCache:
+    """
+    Bounded LRU cache of trend lines. Callers put the source table's version in the key,
+    so a write makes the old entries unreachable and they age out.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
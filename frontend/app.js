@@ -182,12 +182,9 @@ document.addEventListener('DOMContentLoaded', () => {
     switchMode('health'); // Initialize mode display
 
     // Fetch all last entries to pre-fill the forms
-    Promise.all([
-        fetch(`${apiUrl}/api/logs/last`, { credentials: 'include' }).then(r => r.ok ? r.json() : null),
-        fetch(`${apiUrl}/api/jabs/last`, { credentials: 'include' }).then(r => r.ok ? r.json() : null),
-        fetch(`${apiUrl}/api/body-measurements/last`, { credentials: 'include' }).then(r => r.ok ? r.json() : null)
-    ])
-    .then(([lastLog, lastJab, lastMeasurement]) => {
+    fetch(`${apiUrl}/api/latest`, { credentials: 'include' })
+    .then(r => r.ok ? r.json() : {})
+    .then(({ logs: lastLog, jabs: lastJab, body_measurements: lastMeasurement }) => {
         // Populate health log fields
         if (lastLog) {
             populateFields(lastLog, [
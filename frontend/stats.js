@@ -38,12 +38,10 @@ document.addEventListener('DOMContentLoaded', () => {
     function fetchData() {
         // Fetch logs, jabs, body measurements, and medication levels
         Promise.all([
-            fetch(`${apiUrl}/api/logs`, { credentials: 'include' }).then(r => r.ok ? r.json() : []),
-            fetch(`${apiUrl}/api/jabs`, { credentials: 'include' }).then(r => r.ok ? r.json() : []),
-            fetch(`${apiUrl}/api/medication-levels`, { credentials: 'include' }).then(r => r.ok ? r.json() : []),
-            fetch(`${apiUrl}/api/body-measurements`, { credentials: 'include' }).then(r => r.ok ? r.json() : [])
+            fetch(`${apiUrl}/api/dashboard`, { credentials: 'include' }).then(r => r.ok ? r.json() : {}),
+            fetch(`${apiUrl}/api/trends?metrics=weight,body_fat,muscle,sleep`, { credentials: 'include' }).then(r => r.ok ? r.json() : {})
         ])
-            .then(([logs, jabs, medicationLevels, measurements]) => {
+            .then(([{ logs = [], jabs = [], medication_levels: medicationLevels = [], body_measurements: measurements = [] }, trends]) => {
                 allLogs = logs; // Store for editing
                 allJabs = jabs; // Store for editing
                 allMeasurements = measurements; // Store for editing
@@ -121,11 +119,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 };
 
                 const charts = {
-                    weight: { ctx: 'weightChart', label: 'Weight (kg)', data: logs.map(l => l.weight), includeJabs: true, includeMedication: true },
-                    bodyFat: { ctx: 'bodyFatChart', label: 'Body Fat (%)', data: logs.map(l => l.body_fat) },
-                    muscle: { ctx: 'muscleChart', label: 'Muscle (%)', data: logs.map(l => l.muscle) },
+                    weight: { ctx: 'weightChart', label: 'Weight (kg)', data: logs.map(l => l.weight), trend: trends.weight, includeJabs: true, includeMedication: true },
+                    bodyFat: { ctx: 'bodyFatChart', label: 'Body Fat (%)', data: logs.map(l => l.body_fat), trend: trends.body_fat },
+                    muscle: { ctx: 'muscleChart', label: 'Muscle (%)', data: logs.map(l => l.muscle), trend: trends.muscle },
                     visceralFat: { ctx: 'visceralFatChart', label: 'Visceral Fat', data: logs.map(l => l.visceral_fat) },
-                    sleep: { ctx: 'sleepChart', label: 'Sleep (hours)', data: logs.map(l => l.sleep) }
+                    sleep: { ctx: 'sleepChart', label: 'Sleep (hours)', data: logs.map(l => l.sleep), trend: trends.sleep }
                 };
 
                 for (const key in charts) {
@@ -133,7 +131,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     const ctx = document.getElementById(chart.ctx).getContext('2d');
                     let movingAverage = null;
                     if (['weight', 'muscle', 'bodyFat', 'sleep'].includes(key)) {
-                        movingAverage = calculateMovingAverage(chart.data);
+                        // Prefer the server-side trend, it is computed once per change instead of on every render
+                        movingAverage = chart.trend || calculateMovingAverage(chart.data);
                     }
                     const jabData = chart.includeJabs ? jabInfo : null;
                     const medData = chart.includeMedication ? medicationLevels : null;
@@ -225,4 +224,23 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     fetchData();
+
+    // Reload when data changes in another tab or on another device. Bursts of changes
+    // coalesce into one reload; after a reconnect, reload once for what was missed.
+    if (window.EventSource) {
+        const events = new EventSource(`${apiUrl}/api/events`, { withCredentials: true });
+        let refreshTimer = null;
+        let connectedBefore = false;
+        const scheduleRefresh = () => {
+            clearTimeout(refreshTimer);
+            refreshTimer = setTimeout(fetchData, 300);
+        };
+        events.addEventListener('change', scheduleRefresh);
+        events.addEventListener('open', () => {
+            if (connectedBefore) {
+                scheduleRefresh();
+            }
+            connectedBefore = true;
+        });
+    }
 });